@@ -1,49 +1,73 @@
+import time
+
+# Measured from the first line of the app module, before any heavy import
+_boot_started = time.perf_counter()
+
 import os
 import json
-import io
+import asyncio
+import logging
+import threading
 
 from pydantic import BaseModel
-from qdrant_client import QdrantClient
-from qdrant_client.models import Filter, FieldCondition, MatchValue
-from typing import List
-from pypdf import PdfReader
+from typing import List, Optional
 
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import StreamingResponse, HTMLResponse, Response
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request
+from fastapi.responses import StreamingResponse, HTMLResponse, Response, FileResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
+from fastapi.concurrency import run_in_threadpool
 
 from contextlib import asynccontextmanager
 
-from rag.ingestion import ingest_document
+from rag.ingestion import ingest_pages
+from rag.extraction import extract_pages
+from rag import extraction as extraction_module
+from rag.jobs import JobManager, QueueFull
+from rag.batcher import Overloaded
+from rag.blob_store import BlobStore, PDF_SPILL_DIR, PDF_STORE_MB
+from rag.catalog import catalog
+from rag.vector_store import get_chunk_texts, delete_source, reset_collection
 from rag.retrieval import retrieve
 from rag.pipeline import answer_question_stream
 from rag import embeddings as emb_module
 from rag import rerank as rerank_module
+from rag import llm as llm_module
+from rag import answer_cache
+from rag.conversation import conversations
+from rag import metrics
+from rag.warmup import Warmup
+from rag.chunking import get_splitter
+
+logger = logging.getLogger(__name__)
+
+# Models load after the server binds; model-dependent routes wait on this
+warmup = Warmup([
+    ("catalog", catalog.ensure_loaded),
+    ("embeddings", emb_module.preload),
+    ("reranker", rerank_module.preload),
+    # Splitter and tokenizer, used for chunking and prompt token budgets
+    ("tokenizer", get_splitter),
+])
 
 
 @asynccontextmanager
 async def lifespan(app):
-    # Startup: preload heavy ML models so first query is fast
-    import logging
-    logger = logging.getLogger(__name__)
-    logger.info("Preloading ML models...")
-    emb_module.preload()
-    rerank_module.preload()
-    logger.info("All models ready")
+    logger.info(f"App imported in {time.perf_counter() - _boot_started:.2f}s")
+    # Load the LLM into Ollama while the local models load
+    threading.Thread(target=llm_module.warmup, name="ollama-warmup", daemon=True).start()
+    warmup.start()
+    logger.info(f"Accepting traffic {time.perf_counter() - _boot_started:.2f}s after start; models loading in background")
     yield
-    # Shutdown: nothing to clean up
+    extraction_module.shutdown()
 
 
 app = FastAPI(lifespan=lifespan)
 
 OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://ollama:11434")
-QDRANT_HOST = os.getenv("QDRANT_HOST", "http://qdrant:6333")
-
 OLLAMA_URL = f"{OLLAMA_HOST}/api/generate"
-client = QdrantClient(url=QDRANT_HOST)
 
-# In-memory store for uploaded PDF bytes (session-only)
-pdf_store: dict[str, bytes] = {}
+# Uploaded PDF bytes: bounded RAM tier in front of a spill directory on disk
+pdf_store = BlobStore(PDF_SPILL_DIR, max_bytes=PDF_STORE_MB * 1024 * 1024)
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -51,6 +75,21 @@ class AskRequest(BaseModel):
     question: str
     chat_history: List[dict] = []
     selected_sources: List[str] = []
+    # Lets the server keep a rolling summary instead of re-summarizing chat_history
+    conversation_id: Optional[str] = None
+
+
+@app.get("/healthz")
+def healthz():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "ok", "uptime_s": round(time.perf_counter() - _boot_started, 1)}
+
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: 200 once models and the catalog are loaded, 503 until then."""
+    status = warmup.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -58,78 +97,104 @@ async def root():
     with open("static/index.html", "r") as f:
         return f.read()
 
+def _ingest_file(filename: str, progress) -> dict:
+    """Job runner: extract on the process pool, then stream into Qdrant."""
+    if not warmup.wait():
+        raise RuntimeError(f"Models are not ready ({warmup.error or 'still loading'})")
+
+    def pages():
+        # Generator, so extraction is only scheduled if the content changed
+        yield from extract_pages(pdf_store.path(filename))
+
+    return ingest_pages(
+        pages(),
+        filename,
+        progress=progress,
+        byte_size=pdf_store.size(filename),
+        content_hash=pdf_store.digest(filename),
+    )
+
+
+jobs = JobManager(_ingest_file)
+
+
 @app.post("/upload")
 async def upload_document(files: List[UploadFile] = File(...)):
-    results = []
+    """Queue PDFs for background ingestion and return a job id immediately."""
+    rejected = []
+    accepted = []
+    # Blobs this request created; removed again if the queue refuses the job
+    created = []
 
     for file in files:
-        try:
-            # Validate file type
-            if not file.filename.lower().endswith('.pdf'):
-                results.append({
-                    "filename": file.filename,
-                    "status": "error",
-                    "message": "Only PDF files are allowed"
-                })
-                continue
-
-            # Read PDF content
-            content = await file.read()
-            
-            # Store raw PDF bytes for viewer
-            pdf_store[file.filename] = content
-
-            # Extract text from PDF
-            pdf_reader = PdfReader(io.BytesIO(content))
-            text_content = ""
-            
-            for page in pdf_reader.pages:
-                text_content += page.extract_text() + "\n\n"
-            
-            if not text_content.strip():
-                results.append({
-                    "filename": file.filename,
-                    "status": "error",
-                    "message": "No text could be extracted from PDF"
-                })
-                continue
-
-            # Ingest document
-            result = ingest_document(text_content, file.filename)
-            results.append({
-                "filename": file.filename,
-                "status": "success",
-                "result": result
-            })
-        except Exception as e:
-            results.append({
+        # Validate file type
+        if not file.filename.lower().endswith('.pdf'):
+            rejected.append({
                 "filename": file.filename,
                 "status": "error",
-                "message": str(e)
+                "message": "Only PDF files are allowed"
             })
-    
-    return {"results": results}
+            continue
 
-@app.get("/documents")
-def list_documents():
-    try:
-        scroll_result = client.scroll(
-            collection_name="notebook_docs",
-            limit=10000,
-            with_payload=True,
-            with_vectors=False
-        )
+        # Read PDF content
+        content = await file.read()
 
-        sources = set()
+        # Store raw PDF bytes for viewer and for the ingestion worker (a disk write)
+        if file.filename not in pdf_store:
+            created.append(file.filename)
+        await run_in_threadpool(pdf_store.put, file.filename, content)
+        accepted.append(file.filename)
 
-        for point in scroll_result[0]:
-            if point.payload and "source" in point.payload:
-                sources.add(point.payload["source"])
+    if not accepted:
+        return {"job_id": None, "rejected": rejected}
 
-        return {"documents": sorted(list(sources))}
-    
-    except Exception as e:
-        return {"documents": []}
+    try:
+        job = jobs.submit(accepted)
+    except QueueFull as e:
+        # Re-uploads keep their new bytes: the old ones are already overwritten
+        for filename in created:
+            await run_in_threadpool(pdf_store.pop, filename)
+        raise HTTPException(status_code=503, detail=str(e))
+
+    return {"job_id": job.id, "rejected": rejected}
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """Per-file stage, chunk counts and throughput for an ingestion job."""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.snapshot()
+
+
+@app.get("/jobs/{job_id}/stream")
+async def stream_job(job_id: str):
+    """NDJSON stream of job snapshots until every file has finished."""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def ndjson_iter():
+        while True:
+            snapshot = job.snapshot()
+            yield json.dumps(snapshot, ensure_ascii=False) + "\n"
+            if snapshot["status"] == "done":
+                return
+            await asyncio.sleep(0.5)
+
+    return StreamingResponse(
+        ndjson_iter(),
+        media_type="application/x-ndjson",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+@app.get("/documents")
+def list_documents():
+    return {"documents": catalog.sources(), "details": catalog.entries()}
     
 @app.delete("/clear-chat")
 def clear_chat():
@@ -139,18 +204,9 @@ def clear_chat():
 def delete_document(doc_name: str):
     """Delete all chunks belonging to a specific document."""
     try:
-        client.delete(
-            collection_name="notebook_docs",
-            points_selector=Filter(
-                must=[
-                    FieldCondition(
-                        key="source",
-                        match=MatchValue(value=doc_name),
-                    )
-                ]
-            ),
-        )
-        pdf_store.pop(doc_name, None)
+        delete_source(doc_name)
+        pdf_store.pop(doc_name)
+        catalog.remove(doc_name)
         return {"status": "deleted", "document": doc_name}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -158,12 +214,9 @@ def delete_document(doc_name: str):
 @app.delete("/clear-all")
 def clear_all():
     try:
-        client.delete_collection(collection_name="notebook_docs")
-        client.create_collection(
-            collection_name="notebook_docs",
-            vectors_config={"size": 768, "distance": "Cosine"}
-        )
+        reset_collection()
         pdf_store.clear()
+        catalog.clear()
         return {"status": "all data cleared"}
     except Exception as e:
         return {"status": "error", "message": str(e)}
@@ -172,12 +225,9 @@ def clear_all():
 def cleanup():
     """Called via sendBeacon on page unload — clears all session data."""
     try:
-        client.delete_collection(collection_name="notebook_docs")
-        client.create_collection(
-            collection_name="notebook_docs",
-            vectors_config={"size": 768, "distance": "Cosine"}
-        )
+        reset_collection()
         pdf_store.clear()
+        catalog.clear()
         return {"status": "cleaned up"}
     except Exception:
         return {"status": "error"}
@@ -190,49 +240,130 @@ def view_pdf():
         return HTMLResponse(f.read())
 
 
-@app.get("/pdf/{doc_name:path}")
-def get_pdf(doc_name: str):
-    """Serve a stored PDF by filename."""
-    if doc_name not in pdf_store:
-        raise HTTPException(status_code=404, detail="PDF not found")
+def _range_response(data: bytes, range_header: str, headers: dict) -> Response:
+    """Serve `data`, honouring a single-range `Range: bytes=...` request."""
+    total = len(data)
+    units, _, spec = (range_header or "").partition("=")
+    if units.strip() != "bytes" or "," in spec:
+        return Response(content=data, media_type="application/pdf", headers=headers)
+
+    start_s, _, end_s = spec.strip().partition("-")
+    try:
+        if start_s:
+            start = int(start_s)
+            end = min(int(end_s), total - 1) if end_s else total - 1
+        else:
+            start = max(total - int(end_s), 0)
+            end = total - 1
+    except ValueError:
+        return Response(content=data, media_type="application/pdf", headers=headers)
+
+    if start > end or start >= total:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{total}"})
+
     return Response(
-        content=pdf_store[doc_name],
+        content=data[start:end + 1],
+        status_code=206,
         media_type="application/pdf",
-        headers={"Content-Disposition": f'inline; filename="{doc_name}"'},
+        headers={**headers, "Content-Range": f"bytes {start}-{end}/{total}"},
     )
 
 
+@app.get("/pdf/{doc_name:path}")
+def get_pdf(doc_name: str, request: Request):
+    """Serve a stored PDF by filename (supports HTTP Range requests)."""
+    if doc_name not in pdf_store:
+        raise HTTPException(status_code=404, detail="PDF not found")
+
+    data = pdf_store.get_bytes(doc_name)
+    if data is None:
+        # Evicted from RAM: stream the spill file (Range handled by FileResponse)
+        return FileResponse(
+            pdf_store.path(doc_name),
+            media_type="application/pdf",
+            filename=doc_name,
+            content_disposition_type="inline",
+        )
+
+    headers = {
+        "Content-Disposition": f'inline; filename="{doc_name}"',
+        "Accept-Ranges": "bytes",
+    }
+    return _range_response(data, request.headers.get("range"), headers)
+
+
+class ChunkRef(BaseModel):
+    doc: str
+    chunk_index: int
+
+
+class ChunkTextRequest(BaseModel):
+    chunks: List[ChunkRef]
+
+
 @app.get("/chunk-text/{doc_name:path}/{chunk_index}")
 def get_chunk_text(doc_name: str, chunk_index: int):
     """Return the text of a specific chunk for PDF highlighting."""
     try:
-        result = client.scroll(
-            collection_name="notebook_docs",
-            scroll_filter=Filter(
-                must=[
-                    FieldCondition(key="source", match=MatchValue(value=doc_name)),
-                    FieldCondition(key="chunk_index", match=MatchValue(value=chunk_index)),
-                ]
-            ),
-            limit=1,
-            with_payload=True,
-            with_vectors=False,
-        )
-        if result[0]:
-            return {"text": result[0][0].payload.get("text", "")}
-        return {"text": ""}
+        texts = get_chunk_texts([(doc_name, chunk_index)])
+        return {"text": texts.get((doc_name, chunk_index), "")}
     except Exception:
         return {"text": ""}
-    
+
+
+@app.post("/chunk-text")
+def get_chunk_texts_batch(req: ChunkTextRequest):
+    """Return many chunk texts in one call (e.g. every citation in an answer)."""
+    try:
+        texts = get_chunk_texts((c.doc, c.chunk_index) for c in req.chunks)
+    except Exception:
+        texts = {}
+    return {
+        "chunks": [
+            {"doc": c.doc, "chunk_index": c.chunk_index, "text": texts.get((c.doc, c.chunk_index), "")}
+            for c in req.chunks
+        ]
+    }
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus exposition: per-stage latency histograms for /ask and ingestion, model batch queues."""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE_LATEST)
+
+
+@app.get("/stats")
+def stats():
+    """Cache hit/miss counters for the model-serving layer."""
+    return {
+        "embedding_cache": emb_module.cache_stats(),
+        "rerank_cache": rerank_module.cache_stats(),
+        "answer_cache": {**answer_cache.stats(), "collection_version": catalog.version},
+        "conversations": conversations.stats(),
+    }
+
+
 @app.post("/ask")
 def ask(req: AskRequest):
     def ndjson_iter():
-        for msg in answer_question_stream(
-            req.question,
-            chat_history=req.chat_history,
-            selected_sources=req.selected_sources
-        ):
-            yield json.dumps(msg, ensure_ascii=False) + "\n"
+        if not warmup.ready:
+            yield json.dumps({"type": "status", "message": "Loading models..."}) + "\n"
+            if not warmup.wait():
+                error = warmup.error or "Models are still loading, please try again shortly"
+                yield json.dumps({"type": "error", "error": error}) + "\n"
+                return
+        try:
+            for msg in answer_question_stream(
+                req.question,
+                chat_history=req.chat_history,
+                selected_sources=req.selected_sources,
+                conversation_id=req.conversation_id,
+            ):
+                yield json.dumps(msg, ensure_ascii=False) + "\n"
+        except Overloaded as e:
+            logger.warning(f"/ask rejected: {e}")
+            error = "Server busy, please try again in a moment"
+            yield json.dumps({"type": "error", "error": error}) + "\n"
 
     return StreamingResponse(
         ndjson_iter(),
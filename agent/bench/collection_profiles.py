@@ -0,0 +1,147 @@
+"""
+Compare Qdrant collection profiles on recall@k and search latency.
+
+    python -m bench.collection_profiles --url http://localhost:6333 --points 50000
+
+Each profile gets its own scratch collection filled with the same synthetic,
+clustered, normalized vectors. Exact top-k from a brute-force scan is the
+ground truth. Run it against a real Qdrant server: the in-process ":memory:"
+mode ignores HNSW and quantization settings.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from typing import Any, Dict, List
+
+import numpy as np
+
+
+def _vectors(rng: np.random.Generator, n: int, centers: np.ndarray, spread: float) -> np.ndarray:
+    assigned = centers[rng.integers(0, len(centers), size=n)]
+    v = assigned + spread * rng.standard_normal((n, centers.shape[1])).astype(np.float32)
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+def _ground_truth(points: np.ndarray, queries: np.ndarray, k: int) -> List[set]:
+    truth = []
+    for start in range(0, len(queries), 64):
+        scores = queries[start:start + 64] @ points.T
+        top = np.argpartition(-scores, k, axis=1)[:, :k]
+        truth.extend(set(row.tolist()) for row in top)
+    return truth
+
+
+def _wait_indexed(client, collection: str, timeout: float = 600) -> float:
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        info = client.get_collection(collection)
+        if str(info.status).lower().endswith("green"):
+            break
+        time.sleep(0.5)
+    return time.perf_counter() - started
+
+
+def _vector_ram_mb(profile: Dict[str, Any], n: int, dim: int) -> float:
+    """Rough resident size of vector data: fp32 originals unless on disk, plus int8 copies."""
+    ram = 0 if profile.get("on_disk") else n * dim * 4
+    if profile.get("quantization") == "int8":
+        ram += n * dim
+    return round(ram / 2**20, 1)
+
+
+def run_profile(vs, name: str, points: np.ndarray, queries: np.ndarray,
+                truth: List[set], k: int, batch: int, keep: bool) -> Dict[str, Any]:
+    client = vs.client
+    profile = vs.collection_profile(name)
+    collection = f"bench_{name.replace('-', '_')}"
+    if client.collection_exists(collection):
+        client.delete_collection(collection)
+    vs.create_collection(points.shape[1], profile=profile, collection=collection)
+
+    started = time.perf_counter()
+    client.upload_collection(
+        collection_name=collection,
+        vectors=points,
+        ids=list(range(len(points))),
+        batch_size=batch,
+        wait=True,
+    )
+    upload_s = time.perf_counter() - started
+    index_s = _wait_indexed(client, collection)
+
+    params = vs.search_params(profile)
+    for q in queries[:10]:
+        client.query_points(collection, query=q.tolist(), limit=k, search_params=params, with_payload=False)
+
+    latencies, recalls = [], []
+    for q, expected in zip(queries, truth):
+        t = time.perf_counter()
+        res = client.query_points(collection, query=q.tolist(), limit=k, search_params=params, with_payload=False)
+        latencies.append((time.perf_counter() - t) * 1000)
+        recalls.append(len({p.id for p in res.points} & expected) / k)
+
+    if not keep:
+        client.delete_collection(collection)
+
+    lat = np.array(latencies)
+    return {
+        "profile": name,
+        "settings": profile,
+        f"recall@{k}": round(float(np.mean(recalls)), 4),
+        "latency_ms_p50": round(float(np.percentile(lat, 50)), 2),
+        "latency_ms_p95": round(float(np.percentile(lat, 95)), 2),
+        "latency_ms_mean": round(float(lat.mean()), 2),
+        "upload_s": round(upload_s, 2),
+        "index_s": round(index_s, 2),
+        "est_vector_ram_mb": _vector_ram_mb(profile, len(points), points.shape[1]),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=os.getenv("QDRANT_HOST", "http://localhost:6333"))
+    parser.add_argument("--profiles", nargs="*", help="profiles to compare (default: all)")
+    parser.add_argument("--points", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--spread", type=float, default=0.6, help="noise around cluster centers")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=1000, help="points per upload request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="keep the bench_* collections afterwards")
+    parser.add_argument("--out", help="write results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    # vector_store builds its client from QDRANT_HOST at import
+    os.environ["QDRANT_HOST"] = args.url
+    from rag import vector_store as vs
+
+    names = args.profiles or list(vs.COLLECTION_PROFILES)
+    rng = np.random.default_rng(args.seed)
+    centers = rng.standard_normal((args.clusters, args.dim)).astype(np.float32)
+    points = _vectors(rng, args.points, centers, args.spread)
+    queries = _vectors(rng, args.queries, centers, args.spread)
+    truth = _ground_truth(points, queries, args.k)
+
+    results = []
+    for name in names:
+        print(f"[{name}] uploading {args.points} x {args.dim} vectors...", file=sys.stderr)
+        results.append(run_profile(vs, name, points, queries, truth, args.k, args.batch, args.keep))
+
+    recall_key = f"recall@{args.k}"
+    print(f"{'profile':<12} {recall_key:>10} {'p50 ms':>8} {'p95 ms':>8} {'upload s':>9} {'index s':>8} {'vec RAM MB':>11}")
+    for r in results:
+        print(f"{r['profile']:<12} {r[recall_key]:>10.4f} {r['latency_ms_p50']:>8.2f} {r['latency_ms_p95']:>8.2f} "
+              f"{r['upload_s']:>9.2f} {r['index_s']:>8.2f} {r['est_vector_ram_mb']:>11.1f}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"params": vars(args), "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""
+Deterministic synthetic PDF corpus for benchmarks.
+
+Documents are built from a fixed vocabulary of topics so that generated
+questions have relevant chunks to retrieve. PDFs are written by hand (one
+Helvetica text object per page), so no PDF writer library is needed and
+pypdf extracts the text back exactly.
+"""
+import random
+from typing import Iterator, List, Tuple
+
+TOPICS = [
+    "knowledge distillation", "model pruning", "quantization", "retrieval augmentation",
+    "attention heads", "tokenization", "curriculum learning", "data augmentation",
+    "contrastive pretraining", "mixture of experts", "gradient checkpointing", "beam search",
+    "reinforcement learning", "vector indexing", "cross-encoder reranking", "label smoothing",
+]
+VERBS = ["improves", "reduces", "stabilizes", "accelerates", "complicates", "regularizes", "dominates"]
+OBJECTS = ["accuracy", "latency", "memory use", "training time", "recall", "calibration", "throughput"]
+QUALIFIERS = ["on small datasets", "at large batch sizes", "for long documents", "under noisy labels",
+              "in low-resource settings", "when combined with ensembling", "on commodity hardware"]
+
+LINE_CHARS = 95
+LINES_PER_PAGE = 52
+
+
+def _sentence(rng: random.Random, topic: str) -> str:
+    return (f"In our experiments {topic} {rng.choice(VERBS)} {rng.choice(OBJECTS)} "
+            f"{rng.choice(QUALIFIERS)}, by {rng.randint(2, 40)} percent.")
+
+
+def _wrap(text: str, width: int = LINE_CHARS) -> List[str]:
+    lines, line = [], ""
+    for word in text.split():
+        if line and len(line) + 1 + len(word) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        lines.append(line)
+    return lines
+
+
+def document_pages(index: int, pages: int, seed: int = 0) -> List[str]:
+    """Page texts of synthetic document `index`: paragraphs about two or three topics."""
+    rng = random.Random(seed * 1_000_003 + index)
+    topics = rng.sample(TOPICS, 3)
+    out = []
+    for p in range(pages):
+        lines: List[str] = []
+        while len(lines) < LINES_PER_PAGE:
+            topic = topics[(p + len(lines)) % len(topics)]
+            paragraph = " ".join(_sentence(rng, topic) for _ in range(rng.randint(3, 6)))
+            lines.extend(_wrap(paragraph))
+            lines.append("")
+        out.append("\n".join(lines[:LINES_PER_PAGE]))
+    return out
+
+
+def _escape(line: str) -> str:
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages: List[str]) -> bytes:
+    """Minimal PDF 1.4 with one text page per entry of `pages`."""
+    objects: List[bytes] = []
+
+    def add(obj: bytes) -> int:
+        objects.append(obj)
+        return len(objects)
+
+    pages_id = 2 * len(pages) + 2
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    page_ids = []
+    for text in pages:
+        ops = " ".join(f"({_escape(line)}) '" for line in text.split("\n"))
+        stream = f"BT /F1 9 Tf 13 TL 40 790 Td {ops} ET".encode("latin-1")
+        content = add(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (pages_id, font, content)
+        ))
+    kids = b" ".join(b"%d 0 R" % i for i in page_ids)
+    add(b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids)))
+    catalog = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, obj)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % off for off in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    return bytes(out)
+
+
+def corpus(docs: int, pages: int = 3, seed: int = 0) -> Iterator[Tuple[str, bytes]]:
+    """(file name, PDF bytes) for `docs` synthetic documents."""
+    for i in range(docs):
+        yield f"doc_{i:04d}.pdf", make_pdf(document_pages(i, pages, seed))
+
+
+def questions(n: int, seed: int = 0) -> List[str]:
+    """Distinct questions about corpus topics (distinct so the answer cache never hits)."""
+    rng = random.Random(seed)
+    templates = [
+        "How does {t} affect {o}?",
+        "What do the documents say about {t} {q}?",
+        "Compare {t} and {u} in terms of {o}.",
+        "Summarize the findings on {t}.",
+    ]
+    out: List[str] = []
+    seen = set()
+    while len(out) < n:
+        t, u = rng.sample(TOPICS, 2)
+        q = rng.choice(templates).format(t=t, u=u, o=rng.choice(OBJECTS), q=rng.choice(QUALIFIERS))
+        if q not in seen:
+            seen.add(q)
+            out.append(q)
+    return out
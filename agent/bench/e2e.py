@@ -0,0 +1,287 @@
+"""
+Offline end-to-end benchmark: ingestion and question answering.
+
+    python -m bench.e2e --docs 10 100 1000 --questions 20 --out results.json
+    python -m bench.e2e --docs 100 --baseline results.json
+    python -m bench.e2e --docs 100 --questions 100 --concurrency 20 --stub-call-ms 15
+
+Everything runs in-process against QdrantClient(":memory:") and a local
+fake Ollama server (bench.fake_ollama), over a synthetic PDF corpus
+(bench.corpus). Nothing touches the network or a GPU.
+
+With --models stub (default) embeddings are feature-hashed bags of words
+and reranking is lexical overlap, so the numbers isolate the pipeline's
+own overhead; --stub-call-ms adds a fixed, serialized cost per model call to
+mimic an accelerator's per-call overhead, which is what cross-request batching
+amortizes. With --models real the configured EMBED_BACKEND and
+RERANK_BACKEND are used; their weights must already be in the local
+Hugging Face cache (HF_HUB_OFFLINE is set).
+
+Each corpus size runs in a fresh child process so peak RSS and caches are
+per size. Reported per size: extraction and ingestion chunks/s, per-stage
+answer latency from the pipeline's own timings (planning, the
+speculative search that overlaps it, planned retrieval, rerank, context, first token, total; p50/p95), answer throughput with
+--concurrency simultaneous askers, and peak RSS. --out writes JSON;
+--baseline prints the change against a previous --out file.
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import resource
+import subprocess
+import statistics
+import tempfile
+import warnings
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Stub model calls share one simulated device, which runs one call at a time
+_device = threading.Lock()
+
+
+def _device_call(call_ms: float) -> None:
+    if call_ms > 0:
+        with _device:
+            time.sleep(call_ms / 1000)
+
+
+STAGES = ["planning_ms", "speculative_ms", "retrieval_ms", "rerank_ms", "context_ms", "first_token_ms", "total_ms"]
+
+
+class HashEmbedder:
+    """Feature-hashed bag of words, L2-normalized; stands in for the encoder."""
+
+    def __init__(self, dim: int = 768, call_ms: float = 0.0):
+        self.dim = dim
+        self.call_ms = call_ms
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        _device_call(self.call_ms)
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                h = int.from_bytes(hashlib.blake2b(word.strip(".,?").encode(), digest_size=8).digest(), "little")
+                out[row, h % self.dim] += 1.0 if (h >> 63) else -1.0
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.maximum(norms, 1e-9)
+
+
+class LexicalReranker:
+    """Word-overlap scorer with the CrossEncoder.predict interface."""
+
+    def __init__(self, call_ms: float = 0.0):
+        self.call_ms = call_ms
+
+    def predict(self, pairs, show_progress_bar: bool = False, batch_size: int = 32) -> np.ndarray:
+        _device_call(self.call_ms)
+        scores = []
+        for query, passage in pairs:
+            q = set(query.lower().split())
+            p = passage.lower().split()
+            scores.append(len(q.intersection(p)) / (len(p) ** 0.5 or 1.0))
+        return np.array(scores, dtype=np.float32)
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "mean": 0.0}
+    ordered = sorted(values)
+    return {
+        "p50": round(ordered[len(ordered) // 2], 1),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+        "mean": round(statistics.mean(ordered), 1),
+    }
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+
+def run_size(args: argparse.Namespace, docs: int) -> Dict[str, Any]:
+    """Ingest `docs` synthetic PDFs and answer `args.questions` questions, in this process."""
+    from bench.fake_ollama import FakeOllama
+    from bench.corpus import corpus, questions
+
+    fake = FakeOllama(prefill_ms=args.prefill_ms, tokens_per_s=args.tokens_per_s,
+                      answer_tokens=args.answer_tokens).start()
+    workdir = tempfile.mkdtemp(prefix="rag-bench-")
+    # Modules read these at import, so they are set before anything from rag loads
+    os.environ.update({
+        "QDRANT_HOST": ":memory:",
+        "OLLAMA_HOST": fake.url,
+        "CATALOG_PATH": os.path.join(workdir, "catalog.json"),
+        "HF_HUB_OFFLINE": "1",
+    })
+    if args.models == "stub":
+        os.environ["EMBED_CACHE_DIR"] = ""
+    warnings.filterwarnings("ignore", message="Payload indexes have no effect")
+
+    from rag import embeddings, rerank, pipeline
+    from rag.extraction import extract_pages
+    from rag.ingestion import ingest_pages
+    from rag.catalog import catalog
+
+    if args.models == "stub":
+        embeddings._model = HashEmbedder(call_ms=args.stub_call_ms)
+        rerank._reranker = LexicalReranker(call_ms=args.stub_call_ms)
+    else:
+        embeddings.preload()
+        rerank.preload()
+    catalog.ensure_loaded()
+
+    # --- ingestion ---
+    extract_s = ingest_s = 0.0
+    chunks = pages = 0
+    ingest_stages: Dict[str, float] = {}
+    for name, data in corpus(docs, pages=args.pages, seed=args.seed):
+        started = time.perf_counter()
+        page_texts = list(extract_pages(data))
+        extract_s += time.perf_counter() - started
+        pages += len(page_texts)
+
+        started = time.perf_counter()
+        result = ingest_pages(page_texts, name, byte_size=len(data))
+        ingest_s += time.perf_counter() - started
+        chunks += result["chunks_added"]
+        for stage, ms in result.get("timings", {}).items():
+            ingest_stages[stage] = ingest_stages.get(stage, 0.0) + ms
+
+    ingestion = {
+        "pages": pages,
+        "chunks": chunks,
+        "extract_s": round(extract_s, 3),
+        "ingest_s": round(ingest_s, 3),
+        "chunks_per_s": round(chunks / ingest_s, 1) if ingest_s else None,
+        "pages_per_s_extract": round(pages / extract_s, 1) if extract_s else None,
+        "stage_ms": {stage: round(ms, 1) for stage, ms in ingest_stages.items()},
+    }
+    print(f"[{docs} docs] ingested {chunks} chunks from {pages} pages: "
+          f"{ingestion['chunks_per_s']} chunks/s", file=sys.stderr)
+
+    # --- answering (stage timings come from the pipeline's done event) ---
+    def answer(question: str) -> Dict[str, float]:
+        for event in pipeline.answer_question_stream(question):
+            if event["type"] == "done":
+                return event.get("timings", {})
+            if event["type"] == "error":
+                raise RuntimeError(f"Pipeline error: {event.get('error')}")
+        return {}
+
+    per_stage: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        all_timings = list(pool.map(answer, questions(args.questions, seed=args.seed)))
+    answer_s = time.perf_counter() - started
+    for timings in all_timings:
+        per_stage["planning_ms"].append(timings.get("plan", 0.0))
+        per_stage["speculative_ms"].append(timings.get("speculative", 0.0))
+        per_stage["retrieval_ms"].append(timings.get("embed", 0.0) + timings.get("search", 0.0))
+        per_stage["rerank_ms"].append(timings.get("rerank", 0.0))
+        per_stage["context_ms"].append(timings.get("context", 0.0))
+        per_stage["first_token_ms"].append(timings.get("first_token", timings.get("total", 0.0)))
+        per_stage["total_ms"].append(timings.get("total", 0.0))
+
+    fake.stop()
+    return {
+        "docs": docs,
+        "ingestion": ingestion,
+        "answer_ms": {stage: _percentiles(values) for stage, values in per_stage.items()},
+        "concurrency": args.concurrency,
+        "answers_per_s": round(len(all_timings) / answer_s, 2) if answer_s else None,
+        "batching": {"embed": embeddings.cache_stats()["batching"], "rerank": rerank.cache_stats()["batching"]},
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _child_argv(args: argparse.Namespace, docs: int, out: str) -> List[str]:
+    argv = [sys.executable, "-m", "bench.e2e", "--in-process", "--docs", str(docs), "--out", out]
+    for flag in ("pages", "questions", "concurrency", "prefill_ms", "tokens_per_s", "answer_tokens",
+                 "models", "stub_call_ms", "seed"):
+        argv += [f"--{flag.replace('_', '-')}", str(getattr(args, flag))]
+    return argv
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _compare(results: List[Dict[str, Any]], baseline_path: str) -> None:
+    with open(baseline_path) as f:
+        baseline = {r["docs"]: r for r in json.load(f)["results"]}
+
+    def change(new: float, old: float) -> str:
+        return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+    print(f"\nvs. {baseline_path}")
+    for r in results:
+        old = baseline.get(r["docs"])
+        if old is None:
+            continue
+        print(f"  {r['docs']} docs: chunks/s {change(r['ingestion']['chunks_per_s'] or 0, old['ingestion']['chunks_per_s'] or 0)}, "
+              + ", ".join(f"{s} p50 {change(r['answer_ms'][s]['p50'], old['answer_ms'][s]['p50'])}"
+                          for s in STAGES if s in old["answer_ms"])
+              + f", total p95 {change(r['answer_ms']['total_ms']['p95'], old['answer_ms']['total_ms']['p95'])}"
+              + f", answers/s {change(r.get('answers_per_s') or 0, old.get('answers_per_s') or 0)}"
+              + f", peak RSS {change(r['peak_rss_mb'], old['peak_rss_mb'])}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, nargs="+", default=[10, 100, 1000], help="corpus sizes")
+    parser.add_argument("--pages", type=int, default=3, help="pages per document")
+    parser.add_argument("--questions", type=int, default=20, help="questions answered per corpus size")
+    parser.add_argument("--concurrency", type=int, default=1, help="questions answered at the same time")
+    parser.add_argument("--prefill-ms", type=float, default=200.0, help="fake LLM delay before the first token")
+    parser.add_argument("--tokens-per-s", type=float, default=50.0, help="fake LLM decode rate (0 = instant)")
+    parser.add_argument("--answer-tokens", type=int, default=120)
+    parser.add_argument("--models", choices=["stub", "real"], default="stub")
+    parser.add_argument("--stub-call-ms", type=float, default=0.0, help="fixed cost of each stub model call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write results as JSON to this path")
+    parser.add_argument("--baseline", help="earlier --out file to compare against")
+    parser.add_argument("--in-process", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.in_process:
+        results = [run_size(args, args.docs[0])]
+    else:
+        results = []
+        for docs in args.docs:
+            with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as tmp:
+                path = tmp.name
+            subprocess.run(_child_argv(args, docs, path), check=True)
+            with open(path) as f:
+                results.extend(json.load(f)["results"])
+            os.unlink(path)
+
+        print(f"{'docs':>6} {'chunks':>7} {'chunks/s':>9} " + " ".join(f"{s[:-3] + ' p50':>16}" for s in STAGES)
+              + f" {'total p95':>10} {'answers/s':>10} {'peak RSS MB':>12}")
+        for r in results:
+            ing = r["ingestion"]
+            print(f"{r['docs']:>6} {ing['chunks']:>7} {ing['chunks_per_s'] or 0:>9.1f} "
+                  + " ".join(f"{r['answer_ms'][s]['p50']:>16.1f}" for s in STAGES)
+                  + f" {r['answer_ms']['total_ms']['p95']:>10.1f} {r['answers_per_s'] or 0:>10.2f}"
+                  + f" {r['peak_rss_mb']:>12.1f}")
+        if args.baseline:
+            _compare(results, args.baseline)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"commit": _git_commit(), "params": vars(args), "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
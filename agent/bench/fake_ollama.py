@@ -0,0 +1,165 @@
+"""
+A stand-in for the Ollama HTTP API with configurable latency and token rate.
+
+    python -m bench.fake_ollama --port 11434 --prefill-ms 300 --tokens-per-s 40
+
+Serves /api/chat and /api/generate (streaming and not) with the same frame
+shapes and timing fields as Ollama. Planner requests (recognised by their
+system prompt) get a valid JSON plan built from the question; everything
+else gets filler text of the configured length. No model is loaded.
+"""
+import re
+import sys
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+FILLER = ("The documents describe the method in detail [doc_0001.pdf#0] and report "
+          "consistent results across the evaluated settings [doc_0002.pdf#1]. ").split(" ")
+
+
+class FakeOllama:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        prefill_ms: float = 200.0,
+        tokens_per_s: float = 50.0,
+        answer_tokens: int = 120,
+        load_ms: float = 0.0,
+    ):
+        self.prefill_ms = prefill_ms
+        self.tokens_per_s = tokens_per_s
+        self.answer_tokens = answer_tokens
+        self.load_ms = load_ms
+        self.requests = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeOllama":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reply(self, body: Dict[str, Any]) -> Tuple[List[str], int]:
+        """Tokens to send back and the prompt size (≈ chars / 4) for the timing fields."""
+        messages = body.get("messages") or [{"role": "user", "content": body.get("prompt", "")}]
+        system = " ".join(m["content"] for m in messages if m.get("role") == "system")
+        user = messages[-1].get("content", "") if messages else ""
+        prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+
+        if "retrieval planner" in system:
+            match = re.search(r"User Question:\s*(.*)", user, re.DOTALL)
+            question = (match.group(1) if match else user).strip()
+            words = question.rstrip("?").split()
+            plan = {"queries": [question, " ".join(words[len(words) // 2:]) or question], "top_k": 12,
+                    "rounds": 1, "notes": ""}
+            return [json.dumps(plan)], prompt_tokens
+
+        limit = body.get("options", {}).get("num_predict")
+        n = self.answer_tokens if limit is None or limit < 0 else min(limit, self.answer_tokens)
+        return [FILLER[i % len(FILLER)] + " " for i in range(n)], prompt_tokens
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _frame(self, content: str, done: bool, chat: bool) -> Dict[str, Any]:
+                if chat:
+                    return {"message": {"role": "assistant", "content": content}, "done": done}
+                return {"response": content, "done": done}
+
+            def _final(self, frame: Dict[str, Any], prompt_tokens: int, tokens: int, decode_s: float):
+                frame.update({
+                    "load_duration": int(fake.load_ms * 1e6),
+                    "prompt_eval_count": prompt_tokens,
+                    "prompt_eval_duration": int(fake.prefill_ms * 1e6),
+                    "eval_count": tokens,
+                    "eval_duration": int(decode_s * 1e9),
+                })
+                return frame
+
+            def _write_chunk(self, data: bytes) -> None:
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                fake.requests += 1
+                chat = self.path == "/api/chat"
+                tokens, prompt_tokens = fake.reply(body)
+                if not body.get("messages") and not body.get("prompt"):
+                    tokens = []  # load-only request
+                per_token = 1.0 / fake.tokens_per_s if fake.tokens_per_s > 0 else 0.0
+                time.sleep((fake.load_ms + fake.prefill_ms) / 1000)
+
+                if not body.get("stream", True):
+                    time.sleep(per_token * len(tokens))
+                    frame = self._final(self._frame("".join(tokens), True, chat), prompt_tokens,
+                                        len(tokens), per_token * len(tokens))
+                    out = json.dumps(frame).encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(out)))
+                    self.end_headers()
+                    self.wfile.write(out)
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                started = time.perf_counter()
+                try:
+                    for token in tokens:
+                        time.sleep(per_token)
+                        self._write_chunk((json.dumps(self._frame(token, False, chat)) + "\n").encode())
+                    frame = self._final(self._frame("", True, chat), prompt_tokens, len(tokens),
+                                        time.perf_counter() - started)
+                    self._write_chunk((json.dumps(frame) + "\n").encode())
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # client stopped reading
+
+        return Handler
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--prefill-ms", type=float, default=200.0, help="delay before the first token")
+    parser.add_argument("--tokens-per-s", type=float, default=50.0, help="decode rate (0 = instant)")
+    parser.add_argument("--answer-tokens", type=int, default=120, help="tokens per answer")
+    parser.add_argument("--load-ms", type=float, default=0.0, help="reported (and slept) model load time")
+    args = parser.parse_args(argv)
+
+    fake = FakeOllama(args.host, args.port, args.prefill_ms, args.tokens_per_s, args.answer_tokens, args.load_ms)
+    print(f"Fake Ollama listening on {fake.url}", file=sys.stderr)
+    try:
+        fake._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
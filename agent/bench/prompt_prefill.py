@@ -0,0 +1,121 @@
+"""
+Measure Ollama prefill time for follow-up questions over the same context.
+
+    python -m bench.prompt_prefill --ollama http://localhost:11434 --chunks 12 --questions 4
+
+Two prompt layouts are compared on the same synthetic context:
+
+    question-first   the original single prompt: instructions, question, context
+    stable-prefix    fixed system message, then context, conversation, question
+
+For each layout the first question pays the full prefill; follow-ups only
+prefill what differs from the previous prompt when the layout keeps the
+shared part in front. Reports Ollama's prompt_eval_duration per call.
+"""
+import os
+import sys
+import json
+import random
+import argparse
+import statistics
+from typing import Any, Dict, List, Optional
+
+LEGACY_INSTRUCTIONS = """
+Answer the user using ONLY the context below. Format in clean Markdown.
+Cite sources by copying the exact tags from the context (e.g. [filename.pdf#2]).
+Don't put citations inside latex. This will break latex processing. Only clean math should be inside latex delimiters.
+Every key claim must have at least one citation. Do NOT write [source#chunk] literally.
+If context is insufficient, state what is missing.
+""".strip()
+
+QUESTIONS = [
+    "What are the main findings?",
+    "How was the evaluation set up?",
+    "Which limitations are mentioned?",
+    "Summarize the method in three bullet points.",
+    "What would you change about the experiments?",
+    "Which results are most surprising?",
+]
+
+WORDS = ("model data result method layer training accuracy sample query token "
+         "retrieval context index vector latency memory batch score error rate").split()
+
+
+def _context(rng: random.Random, chunks: int, words: int) -> str:
+    parts = []
+    for i in range(chunks):
+        text = " ".join(rng.choice(WORDS) for _ in range(words))
+        parts.append(f"[paper.pdf#{i}] {text.capitalize()}.")
+    return "\n\n".join(parts)
+
+
+def _question_first(question: str, context: str) -> Dict[str, Optional[str]]:
+    prompt = f"{LEGACY_INSTRUCTIONS}\n\nQuestion: {question}\n\nContext:\n{context}\n\nAnswer:"
+    return {"prompt": prompt, "system": None}
+
+
+def _stable_prefix(question: str, context: str) -> Dict[str, Optional[str]]:
+    from rag.pipeline import ANSWER_SYSTEM_PROMPT, _answer_prompt
+
+    return {"prompt": _answer_prompt(question, "", context), "system": ANSWER_SYSTEM_PROMPT}
+
+
+LAYOUTS = {"question-first": _question_first, "stable-prefix": _stable_prefix}
+
+
+def run_layout(llm, name: str, context: str, questions: List[str], num_ctx: int, flush: str) -> Dict[str, Any]:
+    # Evict the previous layout's prefix from Ollama's cache
+    llm.generate_text(flush, max_tokens=1, num_ctx=num_ctx, think=False)
+
+    calls = []
+    for q in questions:
+        stats: Dict[str, Any] = {}
+        llm.generate_text(**LAYOUTS[name](q, context), max_tokens=1, num_ctx=num_ctx, think=False, stats=stats)
+        calls.append({k: stats.get(k) for k in ("prompt_tokens", "prompt_eval_ms", "wall_ms")})
+        print(f"[{name}] prefill {stats.get('prompt_eval_ms')} ms "
+              f"({stats.get('prompt_tokens')} tokens evaluated)", file=sys.stderr)
+
+    follow_ups = [c["prompt_eval_ms"] for c in calls[1:] if c["prompt_eval_ms"] is not None]
+    return {
+        "layout": name,
+        "calls": calls,
+        "first_prefill_ms": calls[0]["prompt_eval_ms"],
+        "follow_up_prefill_ms_mean": round(statistics.mean(follow_ups), 1) if follow_ups else None,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ollama", default=os.getenv("OLLAMA_HOST", "http://localhost:11434"))
+    parser.add_argument("--chunks", type=int, default=12, help="context chunks")
+    parser.add_argument("--chunk-words", type=int, default=350)
+    parser.add_argument("--questions", type=int, default=4, help="questions asked over the same context")
+    parser.add_argument("--num-ctx", type=int, default=8192)
+    parser.add_argument("--layouts", nargs="*", choices=list(LAYOUTS), default=list(LAYOUTS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    # llm reads OLLAMA_HOST at import
+    os.environ["OLLAMA_HOST"] = args.ollama
+    from rag import llm
+
+    rng = random.Random(args.seed)
+    context = _context(rng, args.chunks, args.chunk_words)
+    questions = [QUESTIONS[i % len(QUESTIONS)] for i in range(max(2, args.questions))]
+    flush = " ".join(rng.choice(WORDS) for _ in range(64))
+
+    results = [run_layout(llm, name, context, questions, args.num_ctx, flush) for name in args.layouts]
+
+    print(f"{'layout':<16} {'first ms':>10} {'follow-up ms':>13}")
+    for r in results:
+        print(f"{r['layout']:<16} {r['first_prefill_ms'] or 0:>10.1f} {r['follow_up_prefill_ms_mean'] or 0:>13.1f}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"params": vars(args), "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,51 @@
+import os
+import hashlib
+from typing import Any, Dict, List, Optional
+
+from .cache import LRUCache
+from .embedding_cache import normalize_text
+
+# Entries are also keyed on the catalog version, so they go stale as soon as a
+# document is added or removed; the TTL only bounds how long they are kept.
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "256"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "3600"))
+
+plan_cache = LRUCache(max_items=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL)
+answer_cache = LRUCache(max_items=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL)
+
+
+def normalize_question(question: str) -> str:
+    """Case- and whitespace-insensitive form of a question, minus trailing punctuation."""
+    return normalize_text(question).casefold().rstrip(" ?!.")
+
+
+def _key(*parts: str) -> str:
+    return hashlib.sha1("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+def plan_key(question: str, selected_sources: List[str], version: int) -> str:
+    # The planner only sees the question and collection size, never the chat
+    return _key("plan", normalize_question(question), "\x1f".join(sorted(selected_sources)), str(version))
+
+
+def answer_key(question: str, selected_sources: List[str], chat_summary: str, version: int) -> str:
+    return _key(
+        "answer",
+        normalize_question(question),
+        "\x1f".join(sorted(selected_sources)),
+        normalize_text(chat_summary),
+        str(version),
+    )
+
+
+def get_answer(key: str) -> Optional[Dict[str, Any]]:
+    """A recorded answer: {"metadata": event, "tokens": [...], "llm": stats}."""
+    return answer_cache.get(key)
+
+
+def put_answer(key: str, metadata: Dict[str, Any], tokens: List[str], llm: Dict[str, Any]) -> None:
+    answer_cache.put(key, {"metadata": metadata, "tokens": tokens, "llm": llm})
+
+
+def stats() -> Dict[str, Any]:
+    return {"plans": plan_cache.stats(), "answers": answer_cache.stats()}
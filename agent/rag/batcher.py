@@ -0,0 +1,195 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, List, Optional, Sequence
+
+from .metrics import BATCH_ITEMS, BATCH_QUEUE_ITEMS, BATCH_REJECTED, BATCH_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Set to 0 to call the models directly from each request thread
+MICRO_BATCHING = os.getenv("MICRO_BATCHING", "1") not in ("0", "false", "False")
+# How long an interactive request waits for queue space before it is rejected
+BATCH_ADMIT_TIMEOUT_S = float(os.getenv("BATCH_ADMIT_TIMEOUT_S", "2"))
+
+
+class Overloaded(RuntimeError):
+    """The model queue stayed full for the admission timeout; retry later."""
+
+
+class _Request:
+    __slots__ = ("items", "enqueued", "done", "result", "error")
+
+    def __init__(self, items: Sequence[Any]):
+        self.items = items
+        self.enqueued = time.monotonic()
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class MicroBatcher:
+    """
+    Coalesces model calls from concurrent requests. Callers block in
+    `submit()`; a single worker thread waits up to `max_wait_ms` after the
+    oldest queued request for others to arrive, runs `fn` once over up to
+    `max_batch` items (a larger single request runs on its own) and hands
+    each caller its slice of the results. At most `max_queue` items may
+    wait; beyond that callers wait for space and are rejected with
+    Overloaded after their admission timeout.
+
+    Background work (ingestion) has its own queue. It is split into pieces
+    of at most `max_background` items, and each batch takes interactive
+    requests first and at most `max_background` background items, so a
+    query never waits behind more than one such piece.
+    """
+
+    def __init__(self, name: str, fn: Callable[[List[Any]], Sequence[Any]],
+                 max_batch: int, max_wait_ms: float, max_queue: int,
+                 max_background: Optional[int] = None):
+        self.name = name
+        self._fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = max_queue
+        self.max_background = max(1, min(max_background or max_batch, max_batch))
+        self._pending: Deque[_Request] = deque()
+        self._pending_items = 0
+        self._background: Deque[_Request] = deque()
+        self._background_items = 0
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._batches = 0
+        self._items = 0
+        self._requests = 0
+        self._rejected = 0
+
+    def submit(self, items: Sequence[Any], timeout: Optional[float] = BATCH_ADMIT_TIMEOUT_S,
+               background: bool = False) -> Sequence[Any]:
+        """
+        Results of `fn` for `items`, in order. `timeout` bounds the wait for
+        queue space (None waits indefinitely). `background` requests wait for
+        space indefinitely and yield to interactive ones.
+        """
+        if not items:
+            return []
+        if background:
+            step = self.max_background
+            reqs = [_Request(items[i:i + step]) for i in range(0, len(items), step)]
+            timeout = None
+        else:
+            reqs = [_Request(items)]
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            queued = self._background_items if background else self._pending_items
+            # An empty queue always admits, however large the request
+            while queued and queued + len(items) > self.max_queue:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._rejected += 1
+                    BATCH_REJECTED.labels(self.name).inc()
+                    raise Overloaded(f"{self.name} queue is full ({queued} items waiting)")
+                self._cond.wait(remaining)
+                queued = self._background_items if background else self._pending_items
+            if background:
+                self._background.extend(reqs)
+                self._background_items += len(items)
+            else:
+                self._pending.extend(reqs)
+                self._pending_items += len(items)
+            BATCH_QUEUE_ITEMS.labels(self.name).set(self._pending_items + self._background_items)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"batch-{self.name}", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+        for req in reqs:
+            req.done.wait()
+            if req.error is not None:
+                raise req.error
+        if len(reqs) == 1:
+            return reqs[0].result
+        return [result for req in reqs for result in req.result]
+
+    def _next_batch(self) -> List[_Request]:
+        with self._cond:
+            while not self._pending and not self._background:
+                self._cond.wait()
+            # Give concurrent requests until the oldest one's deadline to join;
+            # background work alone doesn't wait for company
+            if self._pending:
+                deadline = self._pending[0].enqueued + self.max_wait
+                while self._pending_items < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+            batch: List[_Request] = []
+            size = 0
+            while self._pending and (not batch or size + len(self._pending[0].items) <= self.max_batch):
+                req = self._pending.popleft()
+                batch.append(req)
+                size += len(req.items)
+            self._pending_items -= size
+
+            # Then fill leftover room with a bounded share of background work
+            taken = 0
+            while self._background:
+                n = len(self._background[0].items)
+                if (batch or taken) and (size + n > self.max_batch or taken + n > self.max_background):
+                    break
+                batch.append(self._background.popleft())
+                size += n
+                taken += n
+            self._background_items -= taken
+
+            BATCH_QUEUE_ITEMS.labels(self.name).set(self._pending_items + self._background_items)
+            # Wake callers waiting for queue space
+            self._cond.notify_all()
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            started = time.monotonic()
+            items = [item for req in batch for item in req.items]
+            for req in batch:
+                BATCH_WAIT_SECONDS.labels(self.name).observe(started - req.enqueued)
+            BATCH_ITEMS.labels(self.name).observe(len(items))
+            try:
+                results = self._fn(items)
+                offset = 0
+                for req in batch:
+                    req.result = results[offset:offset + len(req.items)]
+                    offset += len(req.items)
+            except BaseException as e:
+                logger.exception(f"{self.name} batch of {len(items)} item(s) failed")
+                for req in batch:
+                    req.error = e
+            finally:
+                self._batches += 1
+                self._items += len(items)
+                self._requests += len(batch)
+                for req in batch:
+                    req.done.set()
+
+    def stats(self) -> dict:
+        with self._cond:
+            depth = self._pending_items
+            background = self._background_items
+        return {
+            "queue_items": depth,
+            "background_items": background,
+            "batches": self._batches,
+            "requests": self._requests,
+            "items": self._items,
+            "avg_batch_items": round(self._items / self._batches, 2) if self._batches else 0.0,
+            "avg_requests_per_batch": round(self._requests / self._batches, 2) if self._batches else 0.0,
+            "rejected": self._rejected,
+            "max_batch": self.max_batch,
+            "max_background": self.max_background,
+            "max_wait_ms": self.max_wait * 1000,
+        }
@@ -0,0 +1,87 @@
+import os
+import hashlib
+import logging
+import threading
+from typing import Optional
+
+from .cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+PDF_STORE_MB = int(os.getenv("PDF_STORE_MB", "128"))
+PDF_SPILL_DIR = os.getenv("PDF_SPILL_DIR", "data/pdfs")
+
+
+class BlobStore:
+    """
+    Named byte blobs with a bounded RAM tier in front of a spill directory.
+
+    Every blob is written through to disk, so the store survives restarts and
+    is shared by all workers pointing at the same directory. RAM holds the most
+    recently used blobs up to `max_bytes`; older ones are served from disk.
+    """
+
+    def __init__(self, spill_dir: str, max_bytes: int):
+        self.spill_dir = spill_dir
+        os.makedirs(spill_dir, exist_ok=True)
+        self._ram = LRUCache(max_bytes=max_bytes, sizeof=len)
+        self._lock = threading.Lock()
+
+    def path(self, name: str) -> str:
+        digest = hashlib.sha1(name.encode("utf-8")).hexdigest()
+        return os.path.join(self.spill_dir, f"{digest}.blob")
+
+    def put(self, name: str, data: bytes) -> None:
+        # Never serve the previous bytes once the file on disk is replaced
+        self._ram.pop(name)
+        path = self.path(name)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        self._ram.put(name, data)
+
+    def get_bytes(self, name: str) -> Optional[bytes]:
+        """RAM-resident bytes, or None if the blob has been evicted to disk."""
+        return self._ram.get(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._ram or os.path.exists(self.path(name))
+
+    def size(self, name: str) -> Optional[int]:
+        data = self._ram.get(name)
+        if data is not None:
+            return len(data)
+        try:
+            return os.path.getsize(self.path(name))
+        except OSError:
+            return None
+
+    def digest(self, name: str) -> str:
+        """sha256 of a blob's bytes."""
+        h = hashlib.sha256()
+        data = self._ram.get(name)
+        if data is not None:
+            h.update(data)
+        else:
+            with open(self.path(name), "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+        return h.hexdigest()
+
+    def pop(self, name: str) -> None:
+        self._ram.pop(name)
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+
+    def clear(self) -> None:
+        self._ram.clear()
+        with self._lock:
+            for entry in os.listdir(self.spill_dir):
+                if entry.endswith(".blob"):
+                    os.remove(os.path.join(self.spill_dir, entry))
+
+    def stats(self) -> dict:
+        return {"ram_items": len(self._ram), "ram_bytes": self._ram.nbytes}
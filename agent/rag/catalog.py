@@ -0,0 +1,316 @@
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+from .vector_store import client, COLLECTION, count_points
+
+logger = logging.getLogger(__name__)
+
+CATALOG_PATH = os.getenv("CATALOG_PATH", "data/catalog.json")
+# After a failed rebuild (Qdrant unreachable), reads serve an empty catalog
+# for this long before scanning again
+CATALOG_RETRY_S = float(os.getenv("CATALOG_RETRY_S", "30"))
+# How often reads check the catalog against Qdrant's point count (first read always does)
+CATALOG_VALIDATE_S = float(os.getenv("CATALOG_VALIDATE_S", "300"))
+
+
+class DocumentCatalog:
+    """
+    Per-source summary of what is in the collection (chunk count, doc_id,
+    ingest time, byte size), kept in step with ingestion and deletion and
+    persisted as JSON so listing documents never has to scan Qdrant.
+
+    The file is re-read when another worker has rewritten it. Every change is
+    a read-modify-write under an exclusive flock on `<path>.lock`, followed by
+    an atomic rename, so workers never drop each other's entries. If the file
+    is missing while the collection has points, it is rebuilt once with a
+    paginated scroll. The file and Qdrant live on separate volumes, so reads
+    also start a background comparison of the catalog's chunk total with the
+    collection's point count (on first load, then every CATALOG_VALIDATE_S),
+    which rebuilds the catalog when they stay apart.
+
+    `version` is bumped on every change so caches derived from the collection
+    (plans, answers) can key on it and go stale automatically.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._docs: Dict[str, Dict[str, Any]] = {}
+        self._version = 0
+        self._stamp: Optional[Tuple[int, int, int]] = None
+        self._loaded = False
+        self._retry_at = 0.0
+        self._validate_at = 0.0
+        self._validating = False
+        self._ingesting = 0
+        # (version, point count) of a mismatch awaiting confirmation
+        self._suspect: Optional[Tuple[int, int]] = None
+
+    @contextmanager
+    def ingesting(self) -> Iterator[None]:
+        """Held by an ingest while its points and its catalog entry may disagree."""
+        with self._lock:
+            self._ingesting += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._ingesting -= 1
+
+    def ensure_loaded(self) -> None:
+        """Load (or rebuild) the catalog now; call before writing new points."""
+        with self._lock:
+            self._refresh()
+
+    # --- reads ---
+
+    def sources(self) -> List[str]:
+        with self._lock:
+            self._refresh()
+            return sorted(self._docs)
+
+    def entries(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            self._refresh()
+            return [{"source": s, **self._docs[s]} for s in sorted(self._docs)]
+
+    def total_chunks(self) -> int:
+        with self._lock:
+            self._refresh()
+            return sum(d["chunks"] for d in self._docs.values())
+
+    @property
+    def version(self) -> int:
+        with self._lock:
+            self._refresh()
+            return self._version
+
+    # --- writes ---
+
+    def get(self, source: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._refresh()
+            entry = self._docs.get(source)
+            return dict(entry) if entry is not None else None
+
+    def add(self, source: str, doc_id: str, chunks: int, byte_size: Optional[int] = None,
+            content_hash: Optional[str] = None) -> None:
+        """
+        Record a document's current chunk count (re-ingesting replaces the
+        entry). `content_hash` is only passed for a completed ingest, so a
+        partial one is retried in full next time.
+        """
+        with self._lock, self._file_lock():
+            self._refresh(locked=True)
+            entry = self._docs.setdefault(source, {})
+            entry["chunks"] = chunks
+            entry["doc_id"] = doc_id
+            entry["ingested_at"] = time.time()
+            if byte_size is not None:
+                entry["bytes"] = byte_size
+            if content_hash is not None:
+                entry["content_hash"] = content_hash
+            else:
+                entry.pop("content_hash", None)
+            self._version += 1
+            self._save()
+
+    def remove(self, source: str) -> None:
+        with self._lock, self._file_lock():
+            self._refresh(locked=True)
+            if self._docs.pop(source, None) is not None:
+                self._version += 1
+                self._save()
+
+    def clear(self) -> None:
+        with self._lock, self._file_lock():
+            self._refresh(locked=True)
+            self._docs = {}
+            self._loaded = True
+            self._version += 1
+            self._save()
+
+    # --- persistence ---
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        """Exclusive across processes; taken by writers (and by rebuilds) only."""
+        if fcntl is None:
+            yield
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(f"{self.path}.lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _file_stamp(self) -> Optional[Tuple[int, int, int]]:
+        # The inode changes on every atomic rename, even within one mtime tick
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _refresh(self, locked: bool = False) -> None:
+        """
+        Pick up the file if another worker rewrote it. `locked` callers hold
+        the file lock and are about to write, so a missing file is rebuilt
+        for them without waiting out a failed rebuild's backoff.
+        """
+        stamp = self._file_stamp()
+        if stamp is not None:
+            if stamp != self._stamp:
+                self._read(stamp)
+            if (not locked and not self._validating and not self._ingesting
+                    and time.monotonic() >= self._validate_at):
+                self._validate_at = time.monotonic() + CATALOG_VALIDATE_S
+                self._validating = True
+                threading.Thread(target=self._validate, name="catalog-check", daemon=True).start()
+        elif not self._loaded and (locked or time.monotonic() >= self._retry_at):
+            if locked:
+                self._rebuild()
+                return
+            with self._file_lock():
+                # Another worker may have rebuilt it while we waited for the lock
+                stamp = self._file_stamp()
+                if stamp is not None:
+                    self._read(stamp)
+                else:
+                    self._rebuild()
+
+    def _read(self, stamp: Tuple[int, int, int]) -> None:
+        with open(self.path) as f:
+            data = json.load(f)
+        self._docs = data.get("documents", {})
+        self._version = data.get("version", 0)
+        self._stamp = stamp
+        self._loaded = True
+
+    def _validate(self) -> None:
+        """
+        Background check that Qdrant's point count matches the catalog, and a
+        rebuild when it doesn't (e.g. a wiped volume). Ingestion writes points
+        before it updates the catalog, so a mismatch only counts when no local
+        ingest is running and, unless the collection is empty, it was already
+        seen with the same catalog version on the previous check.
+        """
+        try:
+            try:
+                stored = count_points()
+            except Exception as e:
+                logger.warning(f"Catalog check skipped, Qdrant unreachable: {e}")
+                return
+            with self._lock:
+                stamp = self._file_stamp()
+                if stamp is not None and stamp != self._stamp:
+                    self._read(stamp)
+                expected = sum(d["chunks"] for d in self._docs.values())
+                version = self._version
+                if self._ingesting or stored == expected:
+                    self._suspect = None
+                    return
+                if stored and self._suspect != (version, stored):
+                    # Confirm soon rather than a full interval later
+                    self._suspect = (version, stored)
+                    self._validate_at = time.monotonic() + CATALOG_RETRY_S
+                    return
+
+            logger.warning(f"Catalog lists {expected} chunk(s) but Qdrant holds {stored}; rebuilding")
+            try:
+                docs = self._scan()
+            except Exception as e:
+                logger.warning(f"Catalog rebuild failed: {e}")
+                return
+            with self._lock, self._file_lock():
+                stamp = self._file_stamp()
+                if stamp is not None and stamp != self._stamp:
+                    self._read(stamp)
+                # Something changed while scanning; the next check decides again
+                if self._ingesting or self._version != version:
+                    return
+                self._install(docs)
+                self._suspect = None
+        finally:
+            self._validating = False
+
+    def _scan(self) -> Dict[str, Dict[str, Any]]:
+        """Per-source chunk counts from a paginated scroll of the whole collection."""
+        docs: Dict[str, Dict[str, Any]] = {}
+        offset = None
+        while client.collection_exists(COLLECTION):
+            points, offset = client.scroll(
+                collection_name=COLLECTION,
+                limit=1000,
+                offset=offset,
+                with_payload=["source", "doc_id"],
+                with_vectors=False,
+            )
+            for pt in points:
+                payload = pt.payload or {}
+                src = payload.get("source")
+                if src is None:
+                    continue
+                entry = docs.setdefault(src, {"chunks": 0, "doc_id": payload.get("doc_id"), "ingested_at": None})
+                entry["chunks"] += 1
+            if offset is None:
+                break
+        return docs
+
+    def _rebuild(self) -> None:
+        """One-off full scan used when no catalog file exists yet."""
+        try:
+            docs = self._scan()
+        except Exception as e:
+            # Qdrant unreachable: keep the current (possibly empty) view and retry after a pause
+            logger.warning(f"Catalog rebuild failed, retrying in {CATALOG_RETRY_S:.0f}s: {e}")
+            self._retry_at = time.monotonic() + CATALOG_RETRY_S
+            return
+        self._install(docs)
+
+    def _install(self, docs: Dict[str, Dict[str, Any]]) -> None:
+        """
+        Replace the catalog with scanned `docs`. Entries whose chunk count
+        still matches keep their metadata; the rest lose their content_hash
+        so a re-upload is diffed, not skipped.
+        """
+        for src, entry in docs.items():
+            known = self._docs.get(src)
+            if known is None:
+                continue
+            kept = {k: v for k, v in known.items() if k not in ("chunks", "doc_id")}
+            if known.get("chunks") != entry["chunks"]:
+                kept.pop("content_hash", None)
+            entry.update(kept)
+        self._docs = docs
+        self._loaded = True
+        self._version += 1
+        self._save()
+        logger.info(f"Rebuilt document catalog: {len(docs)} document(s)")
+
+    def _save(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"collection": COLLECTION, "version": self._version, "documents": self._docs}, f)
+        os.replace(tmp, self.path)
+        self._stamp = self._file_stamp()
+
+
+catalog = DocumentCatalog(CATALOG_PATH)
@@ -1,16 +1,169 @@
-from llama_index.core.node_parser import SentenceSplitter
-from llama_index.core import Document
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+
+@lru_cache(maxsize=None)
+def get_splitter():
+    # llama_index is slow to import, so it is loaded on first use rather than at startup
+    from llama_index.core.node_parser import SentenceSplitter
+
+    return SentenceSplitter(
+        chunk_size=512,
+        chunk_overlap=100
+    )
+
+
+def count_tokens(text: str) -> int:
+    """Token count with the splitter's tokenizer, i.e. in the units of chunk_size."""
+    from llama_index.core.utils import get_tokenizer
+
+    return len(get_tokenizer()(text))
 
-splitter = SentenceSplitter(
-    chunk_size=512,
-    chunk_overlap=100
-)
 
 def chunk_document(text, source):
+    from llama_index.core import Document
+
+    splitter = get_splitter()
     doc=Document(
         text=text,
         metadata={"source": source}
     )
 
     nodes = splitter.get_nodes_from_documents([doc])
-    return [{"text": node.text, "chunk_index": i} for i, node in enumerate(nodes)]
\ No newline at end of file
+    return [{"text": node.text, "chunk_index": i} for i, node in enumerate(nodes)]
+
+
+def _metadata_str(source: str) -> str:
+    """The metadata text the splitter reserves room for in every chunk of `source`."""
+    from llama_index.core import Document
+    from llama_index.core.schema import MetadataMode
+
+    doc = Document(text="", metadata={"source": source})
+    return max(
+        doc.get_metadata_str(mode=MetadataMode.EMBED),
+        doc.get_metadata_str(mode=MetadataMode.LLM),
+        key=len,
+    )
+
+
+class _StreamingMerge:
+    """
+    Incremental form of SentenceSplitter._merge: splits are fed one at a time
+    and chunks are returned as soon as they are closed. The merge carries
+    overlap from chunk to chunk and never starts over, so it cannot be rerun
+    per window; this mirrors its state machine instead, step for step.
+    """
+
+    def __init__(self, chunk_size: int, chunk_overlap: int):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.cur_chunk: List[Tuple[str, int]] = []
+        self.cur_chunk_len = 0
+        self.new_chunk = True
+
+    def _close_chunk(self, out: List[str]) -> None:
+        out.append("".join(text for text, _ in self.cur_chunk))
+        last_chunk = self.cur_chunk
+        self.cur_chunk = []
+        self.cur_chunk_len = 0
+        self.new_chunk = True
+
+        # Carry the tail of the closed chunk into the next one as overlap
+        last_index = len(last_chunk) - 1
+        while (
+            last_index >= 0
+            and self.cur_chunk_len + last_chunk[last_index][1] <= self.chunk_overlap
+        ):
+            overlap_text, overlap_length = last_chunk[last_index]
+            self.cur_chunk_len += overlap_length
+            self.cur_chunk.insert(0, (overlap_text, overlap_length))
+            last_index -= 1
+
+    def feed(self, split) -> List[str]:
+        out: List[str] = []
+        if split.token_size > self.chunk_size:
+            raise ValueError("Single token exceeded chunk size")
+        while True:
+            if self.cur_chunk_len + split.token_size > self.chunk_size and not self.new_chunk:
+                self._close_chunk(out)
+                continue
+
+            # A fresh chunk drops carried overlap until the split fits
+            if self.new_chunk and self.cur_chunk_len + split.token_size > self.chunk_size:
+                while self.cur_chunk and self.cur_chunk_len + split.token_size > self.chunk_size:
+                    _, length = self.cur_chunk.pop(0)
+                    self.cur_chunk_len -= length
+
+            if (
+                split.is_sentence
+                or self.cur_chunk_len + split.token_size <= self.chunk_size
+                or self.new_chunk
+            ):
+                self.cur_chunk_len += split.token_size
+                self.cur_chunk.append((split.text, split.token_size))
+                self.new_chunk = False
+                return out
+
+            self._close_chunk(out)
+
+    def finish(self) -> List[str]:
+        if self.new_chunk:
+            return []
+        return ["".join(text for text, _ in self.cur_chunk)]
+
+
+def iter_chunks(pages: Iterable[str], source: str) -> Iterator[Dict]:
+    """
+    Streaming form of chunk_document over the concatenation of `pages`, with
+    identical chunk text, overlap and chunk_index.
+
+    The splitter's first cut is on its paragraph separator ("\n\n\n"),
+    which only depends on the text around it. Once the document is known to
+    be longer than a chunk and to contain one, every completed paragraph is
+    split and fed to an incremental merge, and only the trailing paragraph
+    stays buffered. Text without a paragraph separator is one unit to the
+    splitter, so it is buffered and split as a whole at the end.
+    """
+    from llama_index.core.node_parser.text.utils import split_text_keep_separator
+
+    splitter = get_splitter()
+    chunk_size = splitter.chunk_size - count_tokens(_metadata_str(source))
+    sep = splitter.paragraph_separator
+    merger = _StreamingMerge(chunk_size, splitter.chunk_overlap)
+
+    buffer = ""
+    streaming = False
+    index = 0
+
+    def emit(raw_chunks: List[str]) -> Iterator[Dict]:
+        nonlocal index
+        for text in splitter._postprocess_chunks(raw_chunks):
+            yield {"text": text, "chunk_index": index}
+            index += 1
+
+    def merge(pieces: List[str]) -> List[str]:
+        raw: List[str] = []
+        for piece in pieces:
+            for split in splitter._split(piece, chunk_size):
+                raw.extend(merger.feed(split))
+        return raw
+
+    for page in pages:
+        buffer += page
+        if not streaming:
+            # Paragraph-level splitting only applies to documents longer than one chunk
+            if sep not in buffer or count_tokens(buffer) <= chunk_size:
+                continue
+            streaming = True
+
+        # The last piece may still grow (or gain a separator) with the next page
+        pieces = split_text_keep_separator(buffer, sep)
+        if len(pieces) < 2:
+            continue
+        yield from emit(merge(pieces[:-1]))
+        buffer = pieces[-1]
+
+    if streaming:
+        yield from emit(merge(split_text_keep_separator(buffer, sep)) + merger.finish())
+    elif buffer.strip():
+        yield from emit(splitter.split_text_metadata_aware(buffer, _metadata_str(source)))
@@ -0,0 +1,112 @@
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from .chunking import count_tokens
+from .llm import max_prompt_tokens
+
+# Optional cap on tokens of retrieved context in the answer prompt; 0 = as
+# much as NUM_CTX leaves after the instructions, conversation and question
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "0"))
+# Shortest shared text between adjacent chunks treated as splitter overlap
+MIN_OVERLAP_CHARS = 20
+
+
+def _position(h: Dict[str, Any], rank: int) -> Tuple[str, str, int]:
+    idx = h.get("chunk_index")
+    return (
+        str(h.get("source", "")),
+        str(h.get("doc_id", "")),
+        # Unindexed hits sort last and are never treated as neighbours
+        int(idx) if idx is not None else 10**9 + 2 * rank,
+    )
+
+
+def _tag(h: Dict[str, Any]) -> str:
+    return f"[{h.get('source', 'unknown')}#{h.get('chunk_index', '?')}]"
+
+
+def overlap_chars(prev: str, nxt: str) -> int:
+    """Length of the longest suffix of `prev` that is also a prefix of `nxt`."""
+    if len(prev) < MIN_OVERLAP_CHARS or len(nxt) < MIN_OVERLAP_CHARS:
+        return 0
+    probe = nxt[:MIN_OVERLAP_CHARS]
+    # The earliest match is the longest overlap
+    idx = prev.find(probe, max(0, len(prev) - len(nxt)))
+    while idx >= 0:
+        if nxt.startswith(prev[idx:]):
+            return len(prev) - idx
+        idx = prev.find(probe, idx + 1)
+    return 0
+
+
+def build_context(
+    hits: List[Dict[str, Any]],
+    max_chunks: int = 8,
+    token_budget: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Pack ranked hits into at most `token_budget` tokens (default: all NUM_CTX
+    can hold) and `max_chunks` chunks.
+
+    Hits are taken in rank order; one that doesn't fit is skipped so a shorter,
+    lower-ranked chunk can still use the space (the top hit is always kept).
+    When neighbouring chunks of the same document are both selected, the text
+    the later one repeats from the earlier (the splitter's overlap) is cut, and
+    the space saved counts towards the budget. Chunks are emitted in document
+    order with their citation tags.
+    """
+    if token_budget is None:
+        token_budget = max_prompt_tokens()
+    selected: Dict[Tuple[str, str, int], Dict[str, Any]] = {}
+    costs: Dict[Tuple[str, str, int], int] = {}
+    used = 0
+    skipped = 0
+
+    def trimmed(pos: Tuple[str, str, int]) -> str:
+        text = str(selected[pos].get("text", ""))
+        prev = selected.get((pos[0], pos[1], pos[2] - 1))
+        if prev is None:
+            return text
+        return text[overlap_chars(str(prev.get("text", "")), text):].lstrip()
+
+    def cost(pos: Tuple[str, str, int]) -> int:
+        return count_tokens(f"{_tag(selected[pos])} {trimmed(pos)}") + 2  # + separator
+
+    positions = {}
+    for rank, h in enumerate(hits):
+        if len(selected) >= max_chunks:
+            break
+        pos = _position(h, rank)
+        if pos in selected:
+            continue
+        positions[id(h)] = pos
+
+        # Adding a chunk may also shorten its already-selected successor
+        selected[pos] = h
+        changed = [p for p in (pos, (pos[0], pos[1], pos[2] + 1)) if p in selected]
+        new_costs = {p: cost(p) for p in changed}
+        delta = sum(c - costs.get(p, 0) for p, c in new_costs.items())
+        if used + delta > token_budget and len(selected) > 1:
+            del selected[pos]
+            skipped += 1
+            continue
+        costs.update(new_costs)
+        used += delta
+
+    ordered = sorted(selected)
+    text = "\n\n".join(f"{_tag(selected[pos])} {trimmed(pos)}" for pos in ordered)
+    tokens = count_tokens(text)
+    untrimmed = count_tokens("\n\n".join(f"{_tag(selected[pos])} {selected[pos].get('text', '')}" for pos in ordered))
+    chosen = [h for h in hits if selected.get(positions.get(id(h))) is h]
+
+    return {
+        "text": text,
+        "hits": chosen,
+        "stats": {
+            "chunks": len(ordered),
+            "skipped": skipped,
+            "tokens": tokens,
+            "budget": token_budget,
+            "overlap_tokens_trimmed": untrimmed - tokens,
+        },
+    }
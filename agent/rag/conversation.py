@@ -0,0 +1,152 @@
+import os
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from .cache import LRUCache
+from .llm import generate_text
+
+logger = logging.getLogger(__name__)
+
+# Recent messages are quoted verbatim up to this many characters; older ones
+# are folded into a running summary
+CHAT_VERBATIM_CHARS = int(os.getenv("CHAT_VERBATIM_CHARS", "1500"))
+# Per-message cap, matching what the prompt has always quoted
+CHAT_MESSAGE_CHARS = 300
+CONVERSATION_TTL = int(os.getenv("CONVERSATION_TTL", "3600"))
+CONVERSATION_MAX = int(os.getenv("CONVERSATION_MAX", "1000"))
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You maintain a running summary of a conversation. Update the summary with the new messages, "
+    "in 2-3 sentences. Focus on key topics and conclusions. Reply with the summary only."
+)
+
+_fold_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chat-fold")
+
+
+def _message(role: str, content: str) -> Dict[str, str]:
+    return {"role": role, "content": (content or "")[:CHAT_MESSAGE_CHARS]}
+
+
+def _fingerprint(msg: Dict[str, str]) -> str:
+    return hashlib.sha1(f"{msg['role']}\0{msg['content']}".encode("utf-8")).hexdigest()
+
+
+class _Conversation:
+    def __init__(self):
+        self.summary = ""
+        self.tail: List[Dict[str, str]] = []   # messages not yet folded
+        self.fingerprints: List[str] = []      # every message seen, in order
+        self.lock = threading.Lock()
+
+    def reset(self) -> None:
+        self.summary = ""
+        self.tail = []
+        self.fingerprints = []
+
+    def append(self, messages: List[Dict[str, str]]) -> None:
+        self.tail.extend(messages)
+        self.fingerprints.extend(_fingerprint(m) for m in messages)
+
+    def sync(self, history: List[Dict[str, str]]) -> None:
+        """
+        Line the stored conversation up with the client's (possibly truncated)
+        history: messages past the overlap are appended; if nothing lines up
+        (history edited, deleted or cleared) start over from `history`.
+        """
+        incoming = [_fingerprint(m) for m in history]
+        for k in range(min(len(self.fingerprints), len(incoming)), 0, -1):
+            if self.fingerprints[-k:] == incoming[:k]:
+                self.append(history[k:])
+                return
+        self.reset()
+        self.append(history)
+
+    def tail_chars(self) -> int:
+        return sum(len(m["content"]) for m in self.tail)
+
+    def fold(self, stats: Optional[dict] = None) -> None:
+        """Fold the oldest tail messages into the summary until the tail fits (one LLM call)."""
+        if self.tail_chars() <= CHAT_VERBATIM_CHARS:
+            return
+        folded = []
+        while self.tail and (not folded or self.tail_chars() > CHAT_VERBATIM_CHARS):
+            folded.append(self.tail.pop(0))
+        # Never leave an assistant reply without its question
+        if self.tail and self.tail[0]["role"] == "assistant":
+            folded.append(self.tail.pop(0))
+
+        turns = "\n".join(f"{m['role']}: {m['content']}" for m in folded)
+        previous = f"Summary so far:\n{self.summary}\n\n" if self.summary else ""
+        prompt = f"{previous}New messages:\n{turns}"
+        self.summary = generate_text(
+            prompt, temperature=0.1, max_tokens=150, think=False, stats=stats, system=SUMMARY_SYSTEM_PROMPT
+        ).strip()
+
+    def render(self) -> str:
+        parts = []
+        if self.summary:
+            parts.append(self.summary)
+        if self.tail:
+            parts.append("Recent messages:\n" + "\n".join(f"{m['role']}: {m['content']}" for m in self.tail))
+        return "\n\n".join(parts)
+
+
+class ConversationStore:
+    """
+    Rolling per-conversation summaries. Recent messages are kept verbatim
+    while short; older turns are folded into the summary one at a time,
+    usually in the background right after an answer completes, so the next
+    question finds its context ready without an LLM round trip.
+    Idle conversations expire after CONVERSATION_TTL.
+    """
+
+    def __init__(self, max_items: int = CONVERSATION_MAX, ttl: int = CONVERSATION_TTL):
+        self._conversations = LRUCache(max_items=max_items, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def _get(self, conversation_id: str) -> _Conversation:
+        with self._lock:
+            conv = self._conversations.get(conversation_id)
+            if conv is None:
+                conv = _Conversation()
+            # Re-insert to restart the idle timer
+            self._conversations.put(conversation_id, conv)
+            return conv
+
+    def context(self, conversation_id: Optional[str], chat_history: List[dict],
+                stats: Optional[dict] = None) -> str:
+        """Prompt context (summary + verbatim recent messages) for a question."""
+        history = [_message(m.get("role", "user"), m.get("content", "")) for m in chat_history or []]
+        conv = self._get(conversation_id) if conversation_id else _Conversation()
+        with conv.lock:
+            conv.sync(history)
+            conv.fold(stats)
+            return conv.render()
+
+    def record_turn(self, conversation_id: Optional[str], question: str, answer: str) -> None:
+        """Add a finished turn and fold it in the background if the tail has outgrown its budget."""
+        if not conversation_id:
+            return
+        conv = self._get(conversation_id)
+        with conv.lock:
+            conv.append([_message("user", question), _message("assistant", answer)])
+            needs_fold = conv.tail_chars() > CHAT_VERBATIM_CHARS
+        if needs_fold:
+            _fold_pool.submit(self._fold_in_background, conv)
+
+    @staticmethod
+    def _fold_in_background(conv: _Conversation) -> None:
+        try:
+            with conv.lock:
+                conv.fold()
+        except Exception:
+            logger.exception("Background conversation fold failed")
+
+    def stats(self) -> dict:
+        return {"conversations": len(self._conversations)}
+
+
+conversations = ConversationStore()
@@ -0,0 +1,170 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+import unicodedata
+from typing import List, Optional
+
+import numpy as np
+
+from .cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form used for cache keys; the text itself is encoded unchanged."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(namespace: str, text: str) -> str:
+    return hashlib.sha1(f"{namespace}\0{text}".encode("utf-8")).hexdigest()
+
+
+class _DiskTier:
+    """
+    Append-only on-disk store: a float32 matrix (memory-mapped for reads)
+    plus a key file whose line N names row N. Single writer per directory.
+    """
+
+    def __init__(self, directory: str, namespace: str):
+        os.makedirs(directory, exist_ok=True)
+        stem = hashlib.sha1(namespace.encode("utf-8")).hexdigest()[:16]
+        self._vec_path = os.path.join(directory, f"{stem}.f32")
+        self._key_path = os.path.join(directory, f"{stem}.keys")
+        self._meta_path = os.path.join(directory, f"{stem}.json")
+        self._lock = threading.Lock()
+        self._index: dict[str, int] = {}
+        self._dim: Optional[int] = None
+        self._mmap: Optional[np.memmap] = None
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self._meta_path):
+            return
+        try:
+            with open(self._meta_path) as f:
+                self._dim = int(json.load(f)["dim"])
+            keys = []
+            if os.path.exists(self._key_path):
+                with open(self._key_path) as f:
+                    keys = [k for k in f.read().split("\n") if k]
+            row_bytes = self._dim * 4
+            vec_bytes = os.path.getsize(self._vec_path) if os.path.exists(self._vec_path) else 0
+            rows_on_disk = vec_bytes // row_bytes
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Embedding disk cache unreadable ({e}); starting empty")
+            self._reset()
+            return
+
+        if rows_on_disk < len(keys):
+            # Vectors are written before keys, so missing vector rows mean the
+            # file was truncated or removed, not a crash mid-write
+            logger.warning(
+                f"Embedding disk cache has {len(keys)} keys but {rows_on_disk} vectors; starting empty"
+            )
+            self._reset()
+            return
+        if vec_bytes != len(keys) * row_bytes:
+            # A crash between the vector and key writes; drop the unnamed rows
+            with open(self._vec_path, "r+b") as f:
+                f.truncate(len(keys) * row_bytes)
+        self._index = {k: row for row, k in enumerate(keys)}
+        logger.info(f"Embedding disk cache: {len(keys)} vectors in {self._vec_path}")
+
+    def _reset(self):
+        for path in (self._vec_path, self._key_path, self._meta_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self._dim = None
+        self._index = {}
+
+    def _rows(self) -> int:
+        return len(self._index)
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        row = self._index.get(key)
+        if row is None:
+            return None
+        with self._lock:
+            if self._mmap is None or row >= self._mmap.shape[0]:
+                self._mmap = np.memmap(
+                    self._vec_path, dtype=np.float32, mode="r",
+                    shape=(self._rows(), self._dim),
+                )
+            return np.array(self._mmap[row])
+
+    def put_many(self, keys: List[str], vectors: np.ndarray) -> None:
+        with self._lock:
+            fresh = list({k: v for k, v in zip(keys, vectors) if k not in self._index}.items())
+            if not fresh:
+                return
+            if self._dim is None:
+                self._dim = int(vectors.shape[1])
+                with open(self._meta_path, "w") as f:
+                    json.dump({"dim": self._dim}, f)
+            block = np.ascontiguousarray([v for _, v in fresh], dtype=np.float32)
+            with open(self._vec_path, "ab") as f:
+                f.write(block.tobytes())
+            with open(self._key_path, "a") as f:
+                f.write("".join(f"{k}\n" for k, _ in fresh))
+            start = self._rows()
+            for offset, (k, _) in enumerate(fresh):
+                self._index[k] = start + offset
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache keyed by (model namespace, normalized text hash).
+    Tier 1 is an in-process LRU bounded by bytes; tier 2 is an optional
+    memory-mapped file store that survives restarts.
+    """
+
+    def __init__(self, namespace: str, max_bytes: int, disk_dir: Optional[str] = None):
+        self.namespace = namespace
+        self._memory = LRUCache(max_bytes=max_bytes, sizeof=lambda v: v.nbytes)
+        self._disk = _DiskTier(disk_dir, namespace) if disk_dir else None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def get_many(self, keys: List[str]) -> List[Optional[np.ndarray]]:
+        out: List[Optional[np.ndarray]] = []
+        memory_hits = disk_hits = 0
+        for key in keys:
+            vec = self._memory.get(key)
+            if vec is not None:
+                memory_hits += 1
+            elif self._disk is not None and (vec := self._disk.get(key)) is not None:
+                disk_hits += 1
+                self._memory.put(key, vec)
+            out.append(vec)
+        with self._stats_lock:
+            self.memory_hits += memory_hits
+            self.disk_hits += disk_hits
+            self.misses += len(keys) - memory_hits - disk_hits
+        return out
+
+    def put_many(self, keys: List[str], vectors: np.ndarray) -> None:
+        for key, vec in zip(keys, vectors):
+            # A row view would keep the whole batch array alive behind one row's nbytes
+            self._memory.put(key, np.array(vec, copy=True))
+        if self._disk is not None:
+            self._disk.put_many(keys, vectors)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            memory_hits, disk_hits, misses = self.memory_hits, self.disk_hits, self.misses
+        lookups = memory_hits + disk_hits + misses
+        return {
+            "namespace": self.namespace,
+            "memory_hits": memory_hits,
+            "disk_hits": disk_hits,
+            "misses": misses,
+            "hit_rate": round((memory_hits + disk_hits) / lookups, 4) if lookups else 0.0,
+            "memory_items": len(self._memory),
+            "memory_bytes": self._memory.nbytes,
+            "disk_items": self._disk._rows() if self._disk is not None else 0,
+        }
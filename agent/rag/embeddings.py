@@ -1,27 +1,56 @@
 import os
+import json
+import time
 import platform
 import logging
-import torch
-from sentence_transformers import SentenceTransformer
-from typing import List
+import threading
+import numpy as np
+from functools import lru_cache
+from typing import Any, Dict, List
+
+from .batcher import MICRO_BATCHING, MicroBatcher
+from .embedding_cache import EmbeddingCache, cache_key, normalize_text
+from .onnx_runtime import ensure_model, load_session, load_tokenizer, run_batches
 
 logger = logging.getLogger(__name__)
 
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "BAAI/bge-base-en-v1.5")
+EMBED_CACHE_MB = int(os.getenv("EMBED_CACHE_MB", "256"))
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", "")
+# torch (fp32), torch-int8 (dynamic quantization of Linear layers, CPU),
+# onnx (fp32 export on ONNX Runtime) or onnx-int8 (quantized export)
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+# Texts encoded at startup to report throughput (0 disables)
+EMBED_BENCH_TEXTS = int(os.getenv("EMBED_BENCH_TEXTS", "32"))
+# Cross-request micro-batching: wait up to this long for concurrent texts...
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "3"))
+# ...up to this many texts per model call...
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "128"))
+# ...with at most this many texts queued before requests are turned away
+EMBED_QUEUE_MAX = int(os.getenv("EMBED_QUEUE_MAX", "2048"))
+# Most ingestion texts per encoder call; queries never wait behind a larger one
+EMBED_BACKGROUND_MAX_BATCH = int(os.getenv("EMBED_BACKGROUND_MAX_BATCH", "32"))
+
+# torch and sentence_transformers are imported on first use (see preload), so
+# importing this module stays cheap and the server can bind immediately.
 
-def _get_device() -> str:
+@lru_cache(maxsize=None)
+def get_device() -> str:
     """
     Auto-detect the best available compute device.
     - macOS Apple Silicon → 'mps' (Metal Performance Shaders)
     - NVIDIA GPU          → 'cuda'
     - Fallback            → 'cpu'
     """
+    import torch
+
     # Check for NVIDIA CUDA GPU
     if torch.cuda.is_available():
         device = "cuda"
         logger.info(f"Using CUDA device: {torch.cuda.get_device_name(0)}")
         return device
-    
+
     # Check for Apple Silicon MPS
     if hasattr(torch.backends, "mps") and torch.backends.mps.is_available():
         device = "mps"
@@ -31,26 +60,197 @@ def _get_device() -> str:
     logger.info("No GPU detected, using CPU")
     return "cpu"
 
-DEVICE = _get_device()
-logger.info(f"Embedding device: {DEVICE}")
 
-_model = SentenceTransformer(EMBEDDING_MODEL, device=DEVICE)
+class TorchEmbedder:
+    def __init__(self, model_id: str, quantized: bool = False):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        device = get_device()
+        self.model = SentenceTransformer(model_id, device=device)
+        if quantized:
+            # Dynamic int8 kernels are CPU-only
+            device = "cpu"
+            self.model = torch.ao.quantization.quantize_dynamic(
+                self.model.to(device), {torch.nn.Linear}, dtype=torch.qint8
+            )
+        self.device = device
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(
+            texts,
+            batch_size=EMBED_BATCH_SIZE,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+            device=self.device,
+            convert_to_numpy=True,
+        ).astype(np.float32, copy=False)
+
+
+def _sentence_config(model_id: str) -> Dict[str, Any]:
+    """Pooling mode and max sequence length from the sentence-transformers config files."""
+    from huggingface_hub import hf_hub_download
+
+    def load(name):
+        with open(hf_hub_download(model_id, name)) as f:
+            return json.load(f)
+
+    modules = load("modules.json")
+    pooling_dir = next(m["path"] for m in modules if m["type"].endswith("Pooling"))
+    pooling = load(f"{pooling_dir}/config.json")
+    try:
+        max_length = load("sentence_bert_config.json").get("max_seq_length") or 512
+    except Exception:
+        max_length = 512
+    return {
+        "pooling": "cls" if pooling.get("pooling_mode_cls_token") else "mean",
+        "max_length": max_length,
+    }
+
+
+class OnnxEmbedder:
+    """
+    ONNX Runtime encoder producing the same normalized vectors as the
+    SentenceTransformer (same pooling and truncation), batched by token length.
+    """
+
+    def __init__(self, model_id: str, quantized: bool = True):
+        self.session = load_session(ensure_model(model_id, "feature-extraction", quantized))
+        self.tokenizer = load_tokenizer(model_id)
+        config = _sentence_config(model_id)
+        self.pooling = config["pooling"]
+        self.max_length = config["max_length"]
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer(texts, truncation=True, max_length=self.max_length)
+        # Rows come back trimmed to each text's real length, so mean pooling
+        # needs no mask
+        hidden = run_batches(self.session, self.tokenizer, dict(encoded), EMBED_BATCH_SIZE)
+        if self.pooling == "cls":
+            vectors = np.stack([h[0] for h in hidden])
+        else:
+            vectors = np.stack([h.mean(axis=0) for h in hidden])
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors.astype(np.float32, copy=False)
+
+
+def load_backend(backend: str = EMBED_BACKEND):
+    if backend in ("torch", "torch-int8"):
+        return TorchEmbedder(EMBEDDING_MODEL, quantized=backend == "torch-int8")
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxEmbedder(EMBEDDING_MODEL, quantized=backend == "onnx-int8")
+    raise ValueError(f"Unknown EMBED_BACKEND: {backend!r} (expected torch, torch-int8, onnx or onnx-int8)")
+
+
+_model = None
+_model_lock = threading.Lock()
+_throughput: Dict[str, Any] = {}
+
+# Non-default backends get their own namespace: their vectors agree with the
+# reference model (see rag.parity) but are not bit-identical.
+_cache = EmbeddingCache(
+    namespace=EMBEDDING_MODEL if EMBED_BACKEND == "torch" else f"{EMBEDDING_MODEL}@{EMBED_BACKEND}",
+    max_bytes=EMBED_CACHE_MB * 1024 * 1024,
+    disk_dir=EMBED_CACHE_DIR or None,
+)
+
+
+def measure_throughput(n: int = EMBED_BENCH_TEXTS) -> Dict[str, Any]:
+    """Encode `n` chunk-sized synthetic texts (bypassing the cache) and record texts/s."""
+    texts = [
+        f"Passage {i}: " + " ".join(f"token{(i * 31 + j) % 997}" for j in range(180))
+        for i in range(n)
+    ]
+    _encode(texts[:1])  # first call pays one-off graph/kernel setup
+    started = time.perf_counter()
+    _encode(texts)
+    elapsed = time.perf_counter() - started
+    _throughput.update({
+        "backend": EMBED_BACKEND,
+        "texts": n,
+        "seconds": round(elapsed, 3),
+        "texts_per_s": round(n / elapsed, 1) if elapsed else None,
+    })
+    return dict(_throughput)
+
+
+def _get_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                started = time.perf_counter()
+                _model = load_backend()
+                device = get_device() if EMBED_BACKEND.startswith("torch") else "onnxruntime/cpu"
+                logger.info(
+                    f"Embedding model loaded: {EMBEDDING_MODEL} ({EMBED_BACKEND}) on {device} "
+                    f"in {time.perf_counter() - started:.1f}s"
+                )
+    return _model
 
 
 def preload():
-    """Ensure embedding model is loaded (already loaded at import time)."""
-    logger.info(f"Embedding model ready: {EMBEDDING_MODEL} on {DEVICE}")
+    """Load the embedding model and report its throughput (call from background warm-up)."""
+    _get_model()
+    if EMBED_BENCH_TEXTS > 0:
+        result = measure_throughput()
+        logger.info(f"Embedding throughput ({EMBED_BACKEND}): {result['texts_per_s']} texts/s")
+
+
+def _encode_direct(texts: List[str]) -> np.ndarray:
+    return _get_model().encode(texts)
+
+
+# One model call serves every request that arrived within EMBED_BATCH_WAIT_MS
+_batcher = MicroBatcher(
+    "embed", _encode_direct,
+    max_batch=EMBED_MAX_BATCH, max_wait_ms=EMBED_BATCH_WAIT_MS, max_queue=EMBED_QUEUE_MAX,
+    max_background=EMBED_BACKGROUND_MAX_BATCH,
+)
+
 
+def cache_stats() -> dict:
+    return {
+        **_cache.stats(),
+        "backend": EMBED_BACKEND,
+        "throughput": dict(_throughput),
+        "batching": _batcher.stats() if MICRO_BATCHING else None,
+    }
 
-def embed_text(text: str | List[str]) -> List[List[float]]:
-    """Embed a string or list of strings. Returns list of vectors."""
+
+def _encode(texts: List[str], background: bool = False) -> np.ndarray:
+    if not MICRO_BATCHING:
+        return _encode_direct(texts)
+    # Background work is split into pieces, whose rows come back as a list
+    return np.asarray(_batcher.submit(texts, background=background))
+
+
+def embed_text(text: str | List[str], background: bool = False) -> List[List[float]]:
+    """
+    Embed a string or list of strings. Returns list of vectors.
+    Interactive calls raise batcher.Overloaded when the model queue stays
+    full; `background` calls (ingestion) wait for room instead and yield
+    the model to interactive ones.
+    """
     if isinstance(text, str):
         text = [text]
-    
-    embeddings = _model.encode(
-        text,
-        normalize_embeddings=True,
-        show_progress_bar=False,
-        device=DEVICE,
-    )
-    return embeddings.tolist()
\ No newline at end of file
+
+    # Normalization only widens cache hits; the model sees the text as given,
+    # so vectors match those already stored in existing collections
+    keys = [cache_key(_cache.namespace, normalize_text(t)) for t in text]
+    vectors = _cache.get_many(keys)
+
+    # Encode each distinct miss once, even if it repeats within the batch
+    missing: dict[str, str] = {}
+    for key, t, vec in zip(keys, text, vectors):
+        if vec is None:
+            missing.setdefault(key, t)
+
+    if missing:
+        miss_keys = list(missing)
+        encoded = _encode([missing[k] for k in miss_keys], background=background)
+        _cache.put_many(miss_keys, encoded)
+        fresh = dict(zip(miss_keys, encoded))
+        vectors = [vec if vec is not None else fresh[key] for key, vec in zip(keys, vectors)]
+
+    return np.stack(vectors).tolist()
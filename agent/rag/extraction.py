@@ -0,0 +1,82 @@
+import io
+import os
+import math
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Union
+
+from pypdf import PdfReader
+
+logger = logging.getLogger(__name__)
+
+# 0 disables the pool and extracts inline on the calling thread
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+
+_pool = None
+
+
+def _get_pool():
+    global _pool
+    if _pool is None and PDF_WORKERS > 0:
+        # spawn, not fork: the parent holds torch thread pools that don't survive fork
+        _pool = ProcessPoolExecutor(
+            max_workers=PDF_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        logger.info(f"PDF extraction pool started with {PDF_WORKERS} worker(s)")
+    return _pool
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _page_text(page) -> str:
+    return page.extract_text() + "\n\n"
+
+
+def _open(source: Union[bytes, str]) -> PdfReader:
+    return PdfReader(io.BytesIO(source) if isinstance(source, bytes) else source)
+
+
+def _extract_range(source: Union[bytes, str], start: int, stop: int) -> List[str]:
+    """Worker entry point: extract pages [start, stop) of one PDF."""
+    reader = _open(source)
+    return [_page_text(reader.pages[i]) for i in range(start, stop)]
+
+
+def extract_pages(source: Union[bytes, str]) -> Iterator[str]:
+    """
+    Schedule text extraction for every page of a PDF on the shared process pool
+    and return an iterator over page texts in page order. `source` is the raw
+    bytes or a file path; paths are cheaper since workers open the file themselves.
+
+    Work is submitted before this returns, so calling it for several files in a
+    row extracts them concurrently; consuming the iterator only waits for the
+    range it needs next.
+    """
+    reader = _open(source)
+    page_count = len(reader.pages)
+    pool = _get_pool()
+
+    if pool is None:
+        return (_page_text(page) for page in reader.pages)
+
+    # Every task re-parses the file, so keep ranges coarse enough that one
+    # document fans out to at most a couple of tasks per worker.
+    per_task = max(PDF_PAGES_PER_TASK, math.ceil(page_count / (PDF_WORKERS * 2)))
+    futures = [
+        pool.submit(_extract_range, source, start, min(start + per_task, page_count))
+        for start in range(0, page_count, per_task)
+    ]
+
+    def pages():
+        for future in futures:
+            yield from future.result()
+
+    return pages()
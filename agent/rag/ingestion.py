@@ -1,25 +1,253 @@
-from .chunking import chunk_document
+from .chunking import iter_chunks
 from .embeddings import embed_text
-from .vector_store import insert_chunks, create_collection
+from .vector_store import (
+    insert_chunks, create_collection, source_points, count_points, update_chunk_indexes,
+    delete_points, chunk_point_id, POINT_ID_NAMESPACE, QDRANT_WRITE_WAIT,
+)
+from .catalog import catalog
+from .metrics import Spans, INGESTED_CHUNKS
 
+import os
 import uuid
+import queue
+import hashlib
+import threading
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+INGEST_QUEUE_DEPTH = int(os.getenv("INGEST_QUEUE_DEPTH", "2"))
+# Batches embedded (and, separately, upserted) at once across all files being
+# ingested. Files still extract in parallel; keeping this at 1 stops a bulk
+# upload from crowding query embeddings out of the embedding model.
+INGEST_EMBED_CONCURRENCY = int(os.getenv("INGEST_EMBED_CONCURRENCY", "1"))
+
+_embed_slots = threading.BoundedSemaphore(max(1, INGEST_EMBED_CONCURRENCY))
+_upsert_slots = threading.BoundedSemaphore(max(1, INGEST_EMBED_CONCURRENCY))
+
+_DONE = object()
+
+
+class _Failed:
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    """Blocking put that gives up once the pipeline is being torn down."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _drain(q: queue.Queue, stop: threading.Event) -> Iterator:
+    while not stop.is_set():
+        try:
+            item = q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if item is _DONE:
+            return
+        if isinstance(item, _Failed):
+            raise item.exc
+        yield item
+
+
+def _start_stage(produce, out_q: queue.Queue, stop: threading.Event) -> threading.Thread:
+    """Run `produce()` on a thread, feeding its items into a bounded queue."""
+    def run():
+        try:
+            for item in produce():
+                if not _put(out_q, item, stop):
+                    return
+            _put(out_q, _DONE, stop)
+        except BaseException as e:
+            _put(out_q, _Failed(e), stop)
+
+    t = threading.Thread(target=run, daemon=True)
+    t.start()
+    return t
+
+
+def _batched(items: Iterable, size: int) -> Iterator[List]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
-def ingest_document(text, source_name):
-    doc_id = str(uuid.uuid4())
 
-    chunks = chunk_document(text, source_name)
+def ingest_pages(
+    pages: Iterable[str],
+    source_name,
+    batch_size: int = INGEST_BATCH_SIZE,
+    progress: Optional[Callable[[str, int], None]] = None,
+    byte_size: Optional[int] = None,
+    content_hash: Optional[str] = None,
+):
+    """
+    Pipelined ingestion: extract+chunk → embed → upsert run as overlapping
+    stages joined by bounded queues, so peak memory depends on batch size
+    rather than document size and the first batches land in Qdrant early.
+    `pages` may be a lazy iterator; it is consumed on the chunking stage.
+    `progress(event, count)` is called with "embedded"/"upserted" per batch.
+    The result includes per-stage `timings` (extract, chunk, embed, upsert,
+    total in ms); stages overlap, so each is that stage's own busy time.
 
-    texts = [c["text"] for c in chunks]
+    Re-ingesting a source is incremental. If `content_hash` (of the file
+    bytes) matches the last completed ingest and Qdrant still holds that
+    many points for the source, `pages` is never read.
+    Otherwise each chunk's point id derives from its text (chunk_point_id):
+    only chunks not already stored are embedded, moved chunks get their
+    chunk_index updated, and chunks that disappeared are deleted once the
+    new version is fully written.
+    """
+    # Keeps the catalog's background check from mistaking this ingest's
+    # points, written before its catalog entry, for drift
+    with catalog.ingesting():
+        return _ingest_pages(pages, source_name, batch_size, progress, byte_size, content_hash)
 
-    embeddings = embed_text(texts)
 
-    create_collection(len(embeddings[0]))
+def _ingest_pages(
+    pages: Iterable[str],
+    source_name,
+    batch_size: int,
+    progress: Optional[Callable[[str, int], None]],
+    byte_size: Optional[int],
+    content_hash: Optional[str],
+):
+    report = progress or (lambda event, count: None)
+    spans = Spans("ingest")
+    # A first-time catalog rebuild must not see this document's own points
+    catalog.ensure_loaded()
 
+    previous = catalog.get(source_name)
+    if (
+        content_hash and previous and previous.get("content_hash") == content_hash
+        # The catalog and Qdrant live on separate volumes; trust it only if the points are there
+        and count_points(source_name) == previous["chunks"]
+    ):
+        return {
+            "chunks_added": 0,
+            "chunks_total": previous["chunks"],
+            "unchanged": True,
+            "doc_id": previous.get("doc_id"),
+            "timings": spans.finish(total="unchanged_total"),
+        }
+
+    doc_id = str(uuid.uuid5(POINT_ID_NAMESPACE, source_name))
     metadata = {
         "source": source_name,
         "doc_id": doc_id
     }
+    existing = source_points(source_name)
+
+    # Filled by the chunk stage; read on this thread only after it finishes
+    seen: Dict[str, int] = {}     # point id → new chunk_index
+    moved: Dict[str, int] = {}    # stored points whose chunk_index changed
+    occurrences: Dict[str, int] = {}
+
+    def keyed(chunks: Iterable[Dict]) -> Iterator[Dict]:
+        """Attach deterministic ids and pass on only chunks that need embedding."""
+        for chunk in chunks:
+            text_hash = hashlib.sha1(chunk["text"].encode("utf-8")).hexdigest()
+            occurrence = occurrences.get(text_hash, 0)
+            occurrences[text_hash] = occurrence + 1
+            point_id = chunk_point_id(source_name, text_hash, occurrence)
+            seen[point_id] = chunk["chunk_index"]
+
+            stored = existing.get(point_id)
+            if stored is None:
+                yield {**chunk, "id": point_id, "text_hash": text_hash}
+            elif stored.get("chunk_index") != chunk["chunk_index"]:
+                moved[point_id] = chunk["chunk_index"]
+
+    stop = threading.Event()
+    chunk_q: queue.Queue = queue.Queue(maxsize=INGEST_QUEUE_DEPTH)
+    embed_q: queue.Queue = queue.Queue(maxsize=INGEST_QUEUE_DEPTH)
+
+    def chunk_stage():
+        # Time pulling chunks includes pulling pages; extract is subtracted at the end
+        chunks = spans.timed_iter("chunk", iter_chunks(spans.timed_iter("extract", pages), source_name))
+        return _batched(keyed(chunks), batch_size)
+
+    def embed_stage():
+        for batch in _drain(chunk_q, stop):
+            with _embed_slots, spans.span("embed"):
+                embeddings = embed_text([c["text"] for c in batch], background=True)
+            report("embedded", len(batch))
+            yield batch, embeddings
+
+    threads = [
+        _start_stage(chunk_stage, chunk_q, stop),
+        _start_stage(embed_stage, embed_q, stop),
+    ]
 
-    insert_chunks(chunks, embeddings, metadata)
+    chunks_added = 0
+    stale: List[str] = []
+    completed = False
 
-    return {"chunks_added": len(chunks), "doc_id": doc_id}
\ No newline at end of file
+    def upsert(batch, embeddings, last: bool) -> None:
+        nonlocal chunks_added
+        wait = QDRANT_WRITE_WAIT == "always" or (last and QDRANT_WRITE_WAIT == "last")
+        with _upsert_slots, spans.span("upsert"):
+            insert_chunks(batch, embeddings, metadata, wait=wait)
+        chunks_added += len(batch)
+        INGESTED_CHUNKS.inc(len(batch))
+        report("upserted", len(batch))
+
+    try:
+        # Each batch is held until the next arrives, so the final one is known
+        # and can be the only write that waits for Qdrant to apply it
+        pending = None
+        for batch, embeddings in _drain(embed_q, stop):
+            if pending is None and chunks_added == 0:
+                create_collection(len(embeddings[0]))
+            if pending is not None:
+                upsert(*pending, last=False)
+            pending = (batch, embeddings)
+        if pending is not None:
+            upsert(*pending, last=True)
+
+        # The new version is complete: fix up moved chunks and drop stale ones
+        wait = QDRANT_WRITE_WAIT != "never"
+        stale = [point_id for point_id in existing if point_id not in seen]
+        with spans.span("upsert"):
+            update_chunk_indexes(source_name, moved, wait=wait)
+            delete_points(source_name, stale, wait=wait)
+        completed = True
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+        if not completed:
+            # Failed ingests are the slow ones worth seeing in /metrics
+            spans.finish(status="error")
+        if completed and seen:
+            catalog.add(source_name, doc_id, len(seen), byte_size=byte_size, content_hash=content_hash)
+        elif completed and existing:
+            catalog.remove(source_name)
+        elif chunks_added:
+            # Partial: old and new chunks coexist until a retry completes
+            catalog.add(source_name, doc_id, len(existing) + chunks_added, byte_size=byte_size)
+
+    spans.add("chunk", -(spans.get("extract") or 0) / 1000)
+    timings = spans.finish()
+    return {
+        "chunks_added": chunks_added,
+        "chunks_total": len(seen),
+        "chunks_unchanged": len(seen) - chunks_added,
+        "chunks_removed": len(stale),
+        "doc_id": doc_id,
+        "timings": timings,
+    }
+
+
+def ingest_document(text, source_name):
+    return ingest_pages([text], source_name)
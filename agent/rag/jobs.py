@@ -0,0 +1,167 @@
+import os
+import time
+import uuid
+import queue
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .cache import LRUCache
+from .extraction import PDF_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# Worker threads processing files. Defaults to the extraction pool size, so
+# a batch of small PDFs keeps every extraction process busy; embedding and
+# upserting stay serialised across files (INGEST_EMBED_CONCURRENCY).
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", str(max(1, PDF_WORKERS))))
+# Files allowed to wait in the queue before uploads are rejected
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "100"))
+# How long finished jobs stay pollable (queued and running ones always are)
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "3600"))
+
+TERMINAL_STAGES = ("done", "error")
+
+
+class QueueFull(Exception):
+    pass
+
+
+class FileProgress:
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.stage = "queued"
+        self.chunks_embedded = 0
+        self.chunks_upserted = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Optional[dict] = None
+        self.message: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            "filename": self.filename,
+            "stage": self.stage,
+            "chunks_embedded": self.chunks_embedded,
+            "chunks_upserted": self.chunks_upserted,
+            "elapsed_s": round(elapsed, 2) if elapsed is not None else None,
+            "chunks_per_s": round(self.chunks_embedded / elapsed, 1) if elapsed else None,
+            "result": self.result,
+            "message": self.message,
+        }
+
+
+class Job:
+    def __init__(self, filenames: List[str]):
+        self.id = uuid.uuid4().hex
+        self.created_at = time.time()
+        self.files = [FileProgress(f) for f in filenames]
+        self._lock = threading.Lock()
+
+    def update(self, index: int, **fields) -> None:
+        with self._lock:
+            for k, v in fields.items():
+                setattr(self.files[index], k, v)
+
+    @property
+    def finished(self) -> bool:
+        return all(f.stage in TERMINAL_STAGES for f in self.files)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            files = [f.to_dict() for f in self.files]
+        if all(f["stage"] in TERMINAL_STAGES for f in files):
+            status = "done"
+        elif all(f["stage"] == "queued" for f in files):
+            status = "queued"
+        else:
+            status = "running"
+        return {
+            "job_id": self.id,
+            "status": status,
+            "files_total": len(files),
+            "files_done": sum(f["stage"] in TERMINAL_STAGES for f in files),
+            "chunks_embedded": sum(f["chunks_embedded"] for f in files),
+            "files": files,
+        }
+
+
+# A runner ingests one file and reports progress via `progress(event, count)`
+Runner = Callable[[str, Callable[[str, int], None]], dict]
+
+
+class JobManager:
+    """
+    Bounded FIFO of files to ingest, drained by a fixed pool of worker threads.
+    Unfinished jobs are held until they finish; finished ones then expire
+    after JOB_TTL_SECONDS (or when more than 1000 are kept).
+    """
+
+    def __init__(self, runner: Runner, concurrency: int = INGEST_CONCURRENCY,
+                 max_queued: int = INGEST_QUEUE_SIZE):
+        self._runner = runner
+        self._queue: "queue.Queue[Tuple[Job, int]]" = queue.Queue()
+        self._max_queued = max_queued
+        self._active: Dict[str, Job] = {}
+        self._finished = LRUCache(max_items=1000, ttl=JOB_TTL_SECONDS)
+        self._admit = threading.Lock()
+        self._workers = [
+            threading.Thread(target=self._work, name=f"ingest-{i}", daemon=True)
+            for i in range(max(1, concurrency))
+        ]
+        for w in self._workers:
+            w.start()
+
+    def submit(self, filenames: List[str]) -> Job:
+        with self._admit:
+            if self._queue.qsize() + len(filenames) > self._max_queued:
+                raise QueueFull(
+                    f"Ingestion queue is full ({self._queue.qsize()} file(s) waiting); try again shortly"
+                )
+            job = Job(filenames)
+            self._active[job.id] = job
+            for i in range(len(filenames)):
+                self._queue.put((job, i))
+        logger.info(f"Queued ingestion job {job.id} with {len(filenames)} file(s)")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._admit:
+            job = self._active.get(job_id)
+        return job if job is not None else self._finished.get(job_id)
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def _work(self) -> None:
+        while True:
+            job, index = self._queue.get()
+            filename = job.files[index].filename
+            job.update(index, stage="extracting", started_at=time.time())
+
+            def progress(event: str, count: int, job=job, index=index) -> None:
+                f = job.files[index]
+                if event == "embedded":
+                    job.update(index, stage="embedding", chunks_embedded=f.chunks_embedded + count)
+                elif event == "upserted":
+                    job.update(index, stage="upserting", chunks_upserted=f.chunks_upserted + count)
+
+            try:
+                result = self._runner(filename, progress)
+                if result.get("chunks_total", result["chunks_added"]) == 0:
+                    job.update(index, stage="error", message="No text could be extracted from PDF")
+                else:
+                    job.update(index, stage="done", result=result)
+            except Exception as e:
+                logger.exception(f"Ingestion failed for {filename}")
+                job.update(index, stage="error", message=str(e))
+            finally:
+                job.update(index, finished_at=time.time())
+                if job.finished:
+                    # The TTL starts once the last file is done
+                    with self._admit:
+                        if self._active.pop(job.id, None) is not None:
+                            self._finished.put(job.id, job)
@@ -2,34 +2,167 @@ import os
 import re
 import json
 import logging
+import time
+import queue
+import threading
 import requests
-from typing import Iterator, Optional
+from requests.adapters import HTTPAdapter
+from typing import Any, Dict, Iterator, List, Optional
 
 logger = logging.getLogger(__name__)
 
 OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://host.docker.internal:11434")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "gemma3:4b")
 DEFAULT_NUM_CTX = int(os.getenv("NUM_CTX", "8192"))
+# Opt-in smaller context sizes an answer may switch down to. Each switch makes
+# Ollama reload the runner and drop its cached prompt prefix, so by default
+# every call uses NUM_CTX. NUM_CTX is always the largest size; bigger ones are ignored
+NUM_CTX_BUCKETS = sorted(
+    {int(n) for n in os.getenv("NUM_CTX_BUCKETS", "").split(",") if n.strip() and int(n) < DEFAULT_NUM_CTX}
+    | {DEFAULT_NUM_CTX}
+)
+# Room kept free in the context window for the generated answer
+ANSWER_RESERVE_TOKENS = int(os.getenv("ANSWER_RESERVE_TOKENS", "1024"))
+# Prompts are counted with the splitter's tokenizer, not the model's; pad the count by this factor
+TOKEN_ESTIMATE_MARGIN = float(os.getenv("TOKEN_ESTIMATE_MARGIN", "1.15"))
+# How long Ollama keeps the model resident after each call ("-1" = forever)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_POOL_SIZE = int(os.getenv("OLLAMA_POOL_SIZE", "8"))
+# A call whose model load took longer than this found the model unloaded
+COLD_LOAD_MS = 500
+# Answer tokens are coalesced into frames of up to this many characters...
+STREAM_FLUSH_CHARS = int(os.getenv("STREAM_FLUSH_CHARS", "64"))
+# ...or flushed once their oldest text has waited this long
+STREAM_FLUSH_MS = float(os.getenv("STREAM_FLUSH_MS", "30"))
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+# One pooled keep-alive session shared by every request thread
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=OLLAMA_POOL_SIZE)
+_session.mount("http://", _adapter)
+_session.mount("https://", _adapter)
+
+
+# num_ctx of the most recent call. Calls that don't need a particular size
+# (planning, summaries) reuse it so they never force a reload
+_loaded_num_ctx = DEFAULT_NUM_CTX
+_num_ctx_lock = threading.Lock()
+
+
+def _resolve_num_ctx(num_ctx: Optional[int]) -> int:
+    global _loaded_num_ctx
+    with _num_ctx_lock:
+        if num_ctx is None:
+            return _loaded_num_ctx
+        _loaded_num_ctx = num_ctx
+        return num_ctx
+
+
+def max_prompt_tokens() -> int:
+    """Largest prompt (in estimated tokens) NUM_CTX can hold next to the answer."""
+    return int((NUM_CTX_BUCKETS[-1] - ANSWER_RESERVE_TOKENS) / TOKEN_ESTIMATE_MARGIN)
+
+
+def pick_num_ctx(prompt_tokens: int) -> int:
+    """
+    num_ctx for an answer: the loaded size while it fits the prompt plus room
+    for the answer, unless a NUM_CTX_BUCKETS size at most half as large also
+    fits (only then is a runner reload worth it).
+    """
+    needed = int(prompt_tokens * TOKEN_ESTIMATE_MARGIN) + ANSWER_RESERVE_TOKENS
+    best = next((size for size in NUM_CTX_BUCKETS if size >= needed), NUM_CTX_BUCKETS[-1])
+    loaded = _resolve_num_ctx(None)
+    if needed <= loaded <= NUM_CTX_BUCKETS[-1] and best * 2 > loaded:
+        return loaded
+    return best
+
+
+def _messages(prompt: str, system: Optional[str]) -> List[Dict[str, str]]:
+    """
+    Chat messages for /api/chat. The system message goes first and should be
+    fixed text, so consecutive calls share a prompt prefix Ollama can reuse
+    from its KV cache instead of prefilling it again.
+    """
+    messages = [{"role": "system", "content": system}] if system else []
+    messages.append({"role": "user", "content": prompt})
+    return messages
+
 
 def _ollama_url(path: str) -> str:
     return f"{OLLAMA_HOST}{path}"
 
+
+def _post(path: str, payload: Dict[str, Any], **kwargs) -> requests.Response:
+    return _session.post(
+        _ollama_url(path),
+        json={"model": OLLAMA_MODEL, "keep_alive": OLLAMA_KEEP_ALIVE, **payload},
+        **kwargs,
+    )
+
+
+def _record_stats(stats: Optional[dict], data: Dict[str, Any], started: float) -> None:
+    """Copy Ollama's timing fields (nanoseconds) into a caller-supplied dict."""
+    if stats is None:
+        return
+    load_ms = data.get("load_duration", 0) / 1e6
+    stats.update({
+        "cold": load_ms > COLD_LOAD_MS,
+        "load_ms": round(load_ms, 1),
+        "prompt_tokens": data.get("prompt_eval_count", 0),
+        "prompt_eval_ms": round(data.get("prompt_eval_duration", 0) / 1e6, 1),
+        "eval_tokens": data.get("eval_count", 0),
+        "eval_ms": round(data.get("eval_duration", 0) / 1e6, 1),
+        "wall_ms": round((time.perf_counter() - started) * 1000, 1),
+    })
+
+
+def warmup() -> Dict[str, Any]:
+    """
+    Load the model into Ollama with the default num_ctx, which later calls
+    without their own size reuse (a different num_ctx forces a reload). An
+    empty prompt only loads.
+    """
+    stats: Dict[str, Any] = {}
+    started = time.perf_counter()
+    try:
+        resp = _post(
+            "/api/generate",
+            {"prompt": "", "stream": False, "options": {"num_ctx": _resolve_num_ctx(DEFAULT_NUM_CTX)}},
+            timeout=300,
+        )
+        resp.raise_for_status()
+        _record_stats(stats, resp.json(), started)
+        logger.info(
+            f"Ollama warm-up: {OLLAMA_MODEL} ready in {stats['wall_ms']:.0f} ms "
+            f"(model load {stats['load_ms']:.0f} ms, keep_alive={OLLAMA_KEEP_ALIVE})"
+        )
+    except Exception as e:
+        logger.warning(f"Ollama warm-up failed: {e}")
+    return stats
+
 def generate_text(
     prompt: str,
     temperature: float = 0.3,
     max_tokens: int = 512,
     num_ctx: int = None,
     think: bool = True,
+    stats: Optional[dict] = None,
+    system: Optional[str] = None,
 ) -> str:
-    """Single-shot text generation (non-streaming)."""
-    if num_ctx is None:
-        num_ctx = DEFAULT_NUM_CTX
+    """
+    Single-shot text generation (non-streaming). `system` is sent as a
+    separate, cacheable system message. If `stats` is given it is filled
+    with load/prefill/decode timings and a `cold` flag.
+    """
+    num_ctx = _resolve_num_ctx(num_ctx)
+    started = time.perf_counter()
     try:
-        resp = requests.post(
-            _ollama_url("/api/generate"),
-            json={
-                "model": OLLAMA_MODEL,
-                "prompt": prompt,
+        resp = _post(
+            "/api/chat",
+            {
+                "messages": _messages(prompt, system),
                 "stream": False,
                 "think": think,
                 "options": {
@@ -41,10 +174,12 @@ def generate_text(
             timeout=120,
         )
         resp.raise_for_status()
-        text = resp.json().get("response", "")
+        data = resp.json()
+        _record_stats(stats, data, started)
+        text = data.get("message", {}).get("content", "")
 
-        # Strip ounds blocks from qwen3
-        text = re.sub(r"ounds", "", text, flags=re.DOTALL).strip()
+        # Strip <think> blocks from reasoning models (e.g. qwen3)
+        text = re.sub(r"<think>.*?</think>", "", text, flags=re.DOTALL).strip()
         return text
 
     except Exception as e:
@@ -52,20 +187,140 @@ def generate_text(
         return ""
 
 
+class ThinkFilter:
+    """
+    Removes <think>…</think> spans from a token stream a chunk at a time.
+    Tags split across token boundaries are handled by holding back only a
+    trailing partial tag until the next chunk arrives.
+    """
+
+    def __init__(self):
+        self._in_think = False
+        self._pending = ""
+
+    def feed(self, chunk: str) -> str:
+        text = self._pending + chunk
+        self._pending = ""
+        out = []
+        pos = 0
+        while True:
+            tag = THINK_CLOSE if self._in_think else THINK_OPEN
+            found = text.find(tag, pos)
+            if found >= 0:
+                if not self._in_think:
+                    out.append(text[pos:found])
+                pos = found + len(tag)
+                self._in_think = not self._in_think
+                continue
+
+            # Hold back a suffix that could be the start of the next tag
+            keep = 0
+            lt = text.rfind("<", max(pos, len(text) - len(tag) + 1))
+            if lt >= 0 and tag.startswith(text[lt:]):
+                keep = len(text) - lt
+            if not self._in_think:
+                out.append(text[pos:len(text) - keep])
+            self._pending = text[len(text) - keep:]
+            return "".join(out)
+
+    def flush(self) -> str:
+        """Emit a held-back partial tag that turned out to be plain text."""
+        rest, self._pending = self._pending, ""
+        return "" if self._in_think else rest
+
+
+_STREAM_END = object()
+
+
+def coalesce(
+    tokens: Iterator[str],
+    max_chars: int = STREAM_FLUSH_CHARS,
+    max_delay_ms: float = STREAM_FLUSH_MS,
+) -> Iterator[str]:
+    """
+    Merge small tokens into larger frames. The first token is sent as soon
+    as it arrives; after that a frame goes out once it holds `max_chars`
+    or its oldest text has waited `max_delay_ms`, even if the model pauses
+    mid-stream. `tokens` is read on a helper thread so the timer can fire
+    while it blocks. The concatenated output is identical to the input.
+    """
+    stop = threading.Event()
+    pulled: "queue.Queue" = queue.Queue()
+
+    def read():
+        try:
+            for token in tokens:
+                if stop.is_set():
+                    break
+                if token:
+                    pulled.put(token)
+            pulled.put(_STREAM_END)
+        except BaseException as e:
+            pulled.put(e)
+        finally:
+            close = getattr(tokens, "close", None)
+            if close is not None:
+                close()
+
+    threading.Thread(target=read, name="stream-coalesce", daemon=True).start()
+
+    buf: list[str] = []
+    size = 0
+    flush_at = None
+    first = True
+    try:
+        while True:
+            timeout = None if flush_at is None else max(0.0, flush_at - time.monotonic())
+            try:
+                item = pulled.get(timeout=timeout)
+            except queue.Empty:
+                yield "".join(buf)
+                buf, size, flush_at = [], 0, None
+                continue
+            if item is _STREAM_END:
+                break
+            if isinstance(item, BaseException):
+                if buf:
+                    yield "".join(buf)
+                raise item
+            if first:
+                first = False
+                yield item
+                continue
+            buf.append(item)
+            size += len(item)
+            if flush_at is None:
+                flush_at = time.monotonic() + max_delay_ms / 1000
+            if size >= max_chars:
+                yield "".join(buf)
+                buf, size, flush_at = [], 0, None
+        if buf:
+            yield "".join(buf)
+    finally:
+        stop.set()
+
+
 def generate_text_stream(
     prompt: str,
     temperature: float = 0.3,
     num_ctx: int = None,
+    stats: Optional[dict] = None,
+    system: Optional[str] = None,
 ) -> Iterator[str]:
-    """Streaming text generation. Yields tokens one at a time. No token limit."""
-    if num_ctx is None:
-        num_ctx = DEFAULT_NUM_CTX
+    """
+    Streaming text generation. Yields visible text per Ollama token, with
+    <think> blocks removed. No token limit. `system` is sent as a separate,
+    cacheable system message.
+    `stats` (optional) is filled from Ollama's final frame once the stream ends.
+    """
+    num_ctx = _resolve_num_ctx(num_ctx)
+    started = time.perf_counter()
+    resp = None
     try:
-        resp = requests.post(
-            _ollama_url("/api/generate"),
-            json={
-                "model": OLLAMA_MODEL,
-                "prompt": prompt,
+        resp = _post(
+            "/api/chat",
+            {
+                "messages": _messages(prompt, system),
                 "stream": True,
                 "options": {
                     "temperature": temperature,
@@ -77,49 +332,33 @@ def generate_text_stream(
         )
         resp.raise_for_status()
 
-        in_think = False
-        think_buffer = ""
+        think_filter = ThinkFilter()
 
         for line in resp.iter_lines():
             if not line:
                 continue
             data = json.loads(line)
-            token = data.get("response", "")
-
-            # Filter out ounds blocks from streaming
-            for char in token:
-                if not in_think:
-                    if think_buffer:
-                        think_buffer += char
-                        if "ounds" in think_buffer:
-                            in_think = True
-                            think_buffer = ""
-                        elif len(think_buffer) > 7:
-                            yield think_buffer
-                            think_buffer = ""
-                        elif not "ounds".startswith(think_buffer):
-                            yield think_buffer
-                            think_buffer = ""
-                    elif char == "<":
-                        think_buffer = char
-                    else:
-                        yield char
-                else:
-                    think_buffer += char
-                    if "ounds" in think_buffer:
-                        in_think = False
-                        think_buffer = ""
+
+            visible = think_filter.feed(data.get("message", {}).get("content", ""))
+            if visible:
+                yield visible
 
             if data.get("done"):
+                _record_stats(stats, data, started)
                 break
 
-        # Flush remaining buffer if it wasn't a think tag
-        if think_buffer and not in_think:
-            yield think_buffer
+        tail = think_filter.flush()
+        if tail:
+            yield tail
 
     except Exception as e:
         logger.error(f"generate_text_stream error: {e}")
         yield f"\n\n[Error: {e}]"
+    finally:
+        # Hand the connection back to the pool (and stop Ollama generating if
+        # the client went away mid-stream)
+        if resp is not None:
+            resp.close()
 
 
 def generate_json(
@@ -128,10 +367,13 @@ def generate_json(
     max_tokens: int = 512,
     num_ctx: int = None,
     think: bool = True,
+    stats: Optional[dict] = None,
+    system: Optional[str] = None,
 ) -> Optional[dict]:
     """Generate and parse JSON from LLM output."""
     text = generate_text(
-        prompt, temperature=temperature, max_tokens=max_tokens, num_ctx=num_ctx, think=think
+        prompt, temperature=temperature, max_tokens=max_tokens, num_ctx=num_ctx, think=think,
+        stats=stats, system=system,
     )
     if not text:
         return None
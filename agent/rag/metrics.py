@@ -0,0 +1,113 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_seconds",
+    "Time spent in each stage of a request or ingestion, by outcome",
+    ["pipeline", "stage", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+ANSWER_TOKENS_PER_SECOND = Histogram(
+    "rag_answer_tokens_per_second",
+    "Decode rate of streamed answers, as reported by Ollama",
+    buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 250),
+)
+INGESTED_CHUNKS = Counter("rag_ingested_chunks_total", "Chunks embedded and written to Qdrant")
+
+# Cross-request model micro-batching (rag.batcher)
+BATCH_QUEUE_ITEMS = Gauge("rag_batcher_queue_items", "Items waiting for a model micro-batch", ["model"])
+BATCH_ITEMS = Histogram(
+    "rag_batcher_batch_items", "Items per batched model call", ["model"],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512),
+)
+BATCH_WAIT_SECONDS = Histogram(
+    "rag_batcher_wait_seconds", "Time a request waited before its batch ran", ["model"],
+    buckets=(0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+BATCH_REJECTED = Counter("rag_batcher_rejected_total", "Requests refused because the model queue was full", ["model"])
+
+
+def render() -> bytes:
+    """Prometheus text exposition of every metric in this process."""
+    return generate_latest()
+
+
+class Spans:
+    """
+    Stage timings for one request or one ingested file. Stages may be
+    recorded from several threads and accumulate if recorded more than once
+    (e.g. per batch). `finish()` observes every stage in STAGE_SECONDS
+    under this pipeline's label and the outcome's `status` (ok, error,
+    rejected, cancelled) and returns the timings in milliseconds.
+    """
+
+    def __init__(self, pipeline: str):
+        self.pipeline = pipeline
+        self.started = time.perf_counter()
+        self._ms: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._finished = False
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self._ms[stage] = self._ms.get(stage, 0.0) + seconds * 1000
+
+    def mark(self, stage: str) -> None:
+        """Record the time elapsed since the start (time to first token, total)."""
+        with self._lock:
+            self._ms[stage] = (time.perf_counter() - self.started) * 1000
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - started)
+
+    def wrap(self, stage: str, fn: Callable) -> Callable:
+        """`fn` timed as `stage`, for handing to a thread pool."""
+        def timed(*args, **kwargs):
+            with self.span(stage):
+                return fn(*args, **kwargs)
+        return timed
+
+    def timed_iter(self, stage: str, items: Iterable) -> Iterator:
+        """Pass `items` through, charging the time spent producing each one to `stage`."""
+        it = iter(items)
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                self.add(stage, time.perf_counter() - started)
+                return
+            self.add(stage, time.perf_counter() - started)
+            yield item
+
+    def get(self, stage: str) -> Optional[float]:
+        with self._lock:
+            return self._ms.get(stage)
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {stage: round(ms, 1) for stage, ms in self._ms.items()}
+
+    @property
+    def finished(self) -> bool:
+        with self._lock:
+            return self._finished
+
+    def finish(self, total: str = "total", status: str = "ok") -> Dict[str, float]:
+        """Mark `total`, export to Prometheus (once) and return the timings."""
+        self.mark(total)
+        with self._lock:
+            if not self._finished:
+                self._finished = True
+                for stage, ms in self._ms.items():
+                    STAGE_SECONDS.labels(self.pipeline, stage, status).observe(ms / 1000)
+        return self.snapshot()
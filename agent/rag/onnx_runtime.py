@@ -0,0 +1,146 @@
+import os
+import inspect
+import logging
+import threading
+from typing import Dict, Iterator, List, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Exported (and quantized) models are written here once and reused
+ONNX_CACHE_DIR = os.getenv("ONNX_CACHE_DIR", "data/onnx")
+# Intra-op threads per session (0 = let ONNX Runtime decide)
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))
+
+ONNX_OPSET = 17
+INPUT_NAMES = ("input_ids", "attention_mask", "token_type_ids")
+
+_export_lock = threading.Lock()
+
+
+def model_dir(model_id: str) -> str:
+    return os.path.join(ONNX_CACHE_DIR, model_id.replace("/", "--"))
+
+
+def _export(model_id: str, task: str, path: str) -> None:
+    """Trace a Hugging Face model to ONNX with dynamic batch and sequence axes."""
+    import torch
+    from transformers import AutoModel, AutoModelForSequenceClassification, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    if task == "sequence-classification":
+        model = AutoModelForSequenceClassification.from_pretrained(model_id)
+    else:
+        model = AutoModel.from_pretrained(model_id)
+    model.eval()
+
+    sample = tokenizer(["query"], ["passage"], return_tensors="pt")
+    names = [n for n in INPUT_NAMES if n in sample]
+
+    class _Wrapper(torch.nn.Module):
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, *inputs):
+            out = self.inner(**dict(zip(names, inputs)))
+            return out.logits if task == "sequence-classification" else out.last_hidden_state
+
+    axes = {n: {0: "batch", 1: "sequence"} for n in names}
+    axes["output"] = {0: "batch"} if task == "sequence-classification" else {0: "batch", 1: "sequence"}
+
+    # torch >= 2.9 defaults to the dynamo exporter, which needs onnxscript;
+    # the TorchScript exporter handles these models and dynamic_axes as-is
+    options = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        options["dynamo"] = False
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with torch.no_grad():
+        torch.onnx.export(
+            _Wrapper(model),
+            tuple(sample[n] for n in names),
+            tmp,
+            input_names=names,
+            output_names=["output"],
+            dynamic_axes=axes,
+            opset_version=ONNX_OPSET,
+            **options,
+        )
+    os.replace(tmp, path)
+    tokenizer.save_pretrained(os.path.dirname(path))
+
+
+def _quantize(src: str, dst: str) -> None:
+    """Dynamic int8 quantization of weights; activations stay float."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    tmp = f"{dst}.{os.getpid()}.tmp"
+    quantize_dynamic(src, tmp, weight_type=QuantType.QInt8)
+    os.replace(tmp, dst)
+
+
+def ensure_model(model_id: str, task: str, quantized: bool) -> str:
+    """
+    Path to the ONNX export of `model_id` (int8 if `quantized`), exporting and
+    quantizing on first use. `task` is "sequence-classification" or
+    "feature-extraction".
+    """
+    directory = model_dir(model_id)
+    fp32 = os.path.join(directory, f"{task}.onnx")
+    int8 = os.path.join(directory, f"{task}.int8.onnx")
+    with _export_lock:
+        if not os.path.exists(fp32):
+            os.makedirs(directory, exist_ok=True)
+            logger.info(f"Exporting {model_id} ({task}) to ONNX: {fp32}")
+            _export(model_id, task, fp32)
+        if quantized and not os.path.exists(int8):
+            logger.info(f"Quantizing {fp32} to int8")
+            _quantize(fp32, int8)
+    return int8 if quantized else fp32
+
+
+def load_session(path: str):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if ONNX_THREADS > 0:
+        options.intra_op_num_threads = ONNX_THREADS
+    return ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+def load_tokenizer(model_id: str):
+    from transformers import AutoTokenizer
+
+    return AutoTokenizer.from_pretrained(model_id)
+
+
+def length_batches(lengths: Sequence[int], batch_size: int) -> Iterator[List[int]]:
+    """
+    Indices grouped into batches of similar token length (longest first), so
+    each batch is padded only to its own longest member.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    for start in range(0, len(order), batch_size):
+        yield order[start:start + batch_size]
+
+
+def run_batches(session, tokenizer, encodings: Dict[str, List[List[int]]], batch_size: int) -> List[np.ndarray]:
+    """
+    Run `session` over pre-tokenized, unpadded inputs in length-sorted batches.
+    Returns one output row per input, in input order.
+    """
+    wanted = {i.name for i in session.get_inputs()}
+    lengths = [len(ids) for ids in encodings["input_ids"]]
+    results: List[np.ndarray] = [None] * len(lengths)
+
+    for batch in length_batches(lengths, batch_size):
+        features = [{k: v[i] for k, v in encodings.items()} for i in batch]
+        padded = tokenizer.pad(features, padding="longest", return_tensors="np")
+        feed = {k: padded[k].astype(np.int64) for k in padded if k in wanted}
+        out = session.run(None, feed)[0]
+        for row, i in enumerate(batch):
+            results[i] = out[row] if out.ndim < 3 else out[row, : lengths[i]]
+    return results
@@ -0,0 +1,192 @@
+"""
+Accuracy parity between the reference PyTorch models and the ONNX backends,
+and between streaming and one-shot chunking.
+
+    python -m rag.parity rerank --backend onnx-int8 --top-n 8 --min-overlap 0.85
+    python -m rag.parity embed --backend onnx-int8 --min-cosine 0.99
+    python -m rag.parity chunks --docs 30
+
+Exits non-zero when the backend falls below the pinned threshold (or any
+streamed document chunks differently), so it can gate a deployment that
+switches RERANK_BACKEND or EMBED_BACKEND, or a llama_index upgrade.
+"""
+import sys
+import random
+import argparse
+import logging
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_QUERIES = [
+    "What are the key findings of the study?",
+    "How is the model trained and evaluated?",
+    "What limitations do the authors acknowledge?",
+    "Summarize the methodology section",
+    "Which datasets were used in the experiments?",
+]
+
+SAMPLE_PASSAGES = [
+    "The study finds that retrieval augmentation reduces factual errors by a third compared to the baseline.",
+    "Our key result is a consistent improvement in accuracy across all five benchmarks.",
+    "The model is trained for three epochs with AdamW and a linear learning-rate warm-up.",
+    "Evaluation uses held-out test splits and reports exact match and F1.",
+    "A limitation of this work is that all experiments are in English.",
+    "We acknowledge that the approach is sensitive to the quality of the retrieved documents.",
+    "The methodology combines a dense retriever with a cross-encoder reranker and a generator.",
+    "Section 3 describes the data collection process and annotation guidelines.",
+    "Experiments use Natural Questions, TriviaQA and HotpotQA.",
+    "We additionally evaluate on a proprietary dataset of customer support tickets.",
+    "The weather in the region was unusually warm during the data collection period.",
+    "Table 2 lists hyperparameters for every model size.",
+    "Future work will extend the method to multilingual corpora.",
+    "The authors thank the anonymous reviewers for their feedback.",
+    "Latency is dominated by the generation step, not retrieval.",
+    "Human raters preferred the augmented answers in 71% of comparisons.",
+    "Chunks are 512 tokens with 50 tokens of overlap.",
+    "The baseline is a closed-book model of the same size.",
+    "Ablations show that removing the reranker costs four points of accuracy.",
+    "Code and data are released under an open licence.",
+]
+
+
+def _top(scores: Sequence[float], n: int) -> List[int]:
+    return sorted(range(len(scores)), key=lambda i: -scores[i])[:n]
+
+
+def rerank_parity(
+    backend: str = "onnx-int8",
+    top_n: int = 8,
+    queries: Optional[List[str]] = None,
+    passages: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """Top-n overlap between the torch cross-encoder and `backend`, per query and overall."""
+    from .rerank import load_backend
+
+    queries = queries or SAMPLE_QUERIES
+    passages = passages or SAMPLE_PASSAGES
+    reference = load_backend("torch")
+    candidate = load_backend(backend)
+
+    overlaps = []
+    for q in queries:
+        pairs = [(q, p) for p in passages]
+        ref = [float(s) for s in reference.predict(pairs, show_progress_bar=False)]
+        got = [float(s) for s in candidate.predict(pairs, show_progress_bar=False)]
+        n = min(top_n, len(passages))
+        overlaps.append(len(set(_top(ref, n)) & set(_top(got, n))) / n)
+
+    return {
+        "backend": backend,
+        "top_n": top_n,
+        "per_query": overlaps,
+        "min_overlap": min(overlaps),
+        "mean_overlap": sum(overlaps) / len(overlaps),
+    }
+
+
+def embedding_parity(
+    backend: str = "onnx-int8",
+    texts: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """
+    Cosine similarity between each text's vector from the reference torch
+    encoder and from `backend`. High agreement means vectors already stored
+    in Qdrant stay comparable with queries encoded by the new backend.
+    """
+    from .embeddings import load_backend
+
+    texts = texts or SAMPLE_QUERIES + SAMPLE_PASSAGES
+    reference = load_backend("torch").encode(texts)
+    candidate = load_backend(backend).encode(texts)
+    # Both sides are L2-normalized, so the row-wise dot product is the cosine
+    cosines = np.sum(reference * candidate, axis=1)
+
+    return {
+        "backend": backend,
+        "texts": len(texts),
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+    }
+
+
+def _sample_pages(rng: random.Random) -> List[str]:
+    """Pages of sample sentences joined by single newlines, blank lines and paragraph breaks."""
+    pages = []
+    for _ in range(rng.randint(1, 25)):
+        paragraphs = [
+            " ".join(rng.choice(SAMPLE_PASSAGES) for _ in range(rng.randint(1, 12)))
+            for _ in range(rng.randint(1, 6))
+        ]
+        # "\n\n\n" is the splitter's paragraph separator; "\n\n\n\n" overlaps it
+        pages.append(rng.choice(["\n", "\n\n", "\n\n\n", "\n\n\n\n"]).join(paragraphs) + "\n\n")
+    return pages
+
+
+def chunking_parity(docs: int = 30, seed: int = 0) -> Dict[str, Any]:
+    """Documents whose streamed chunks (iter_chunks) differ from chunk_document's."""
+    from .chunking import chunk_document, iter_chunks
+
+    rng = random.Random(seed)
+    mismatched = []
+    for i in range(docs):
+        pages = _sample_pages(rng)
+        expected = chunk_document("".join(pages), f"doc-{i}.pdf")
+        got = list(iter_chunks(pages, f"doc-{i}.pdf"))
+        if got != expected:
+            mismatched.append({"doc": i, "expected": len(expected), "got": len(got)})
+
+    return {"docs": docs, "seed": seed, "mismatched": mismatched}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="check", required=True)
+
+    rr = sub.add_parser("rerank", help="top-n overlap of a reranker backend vs. torch")
+    rr.add_argument("--backend", default="onnx-int8")
+    rr.add_argument("--top-n", type=int, default=8)
+    rr.add_argument("--min-overlap", type=float, default=0.85,
+                    help="fail if any query's top-n overlap is below this")
+    rr.add_argument("--passages", help="file with one passage per line (default: built-in sample)")
+
+    em = sub.add_parser("embed", help="cosine agreement of an embedding backend vs. torch")
+    em.add_argument("--backend", default="onnx-int8")
+    em.add_argument("--min-cosine", type=float, default=0.99,
+                    help="fail if any text's cosine to the reference vector is below this")
+    em.add_argument("--passages", help="file with one text per line (default: built-in sample)")
+
+    ch = sub.add_parser("chunks", help="streamed vs. one-shot chunking of random multi-paragraph documents")
+    ch.add_argument("--docs", type=int, default=30)
+    ch.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    passages = None
+    if getattr(args, "passages", None):
+        with open(args.passages) as f:
+            passages = [line.strip() for line in f if line.strip()]
+
+    if args.check == "rerank":
+        result = rerank_parity(args.backend, args.top_n, passages=passages)
+        ok = result["min_overlap"] >= args.min_overlap
+        summary = (f"min top-{args.top_n} overlap {result['min_overlap']:.2f} "
+                   f"(threshold {args.min_overlap:.2f})")
+    elif args.check == "chunks":
+        result = chunking_parity(args.docs, args.seed)
+        ok = not result["mismatched"]
+        summary = f"{len(result['mismatched'])} of {args.docs} document(s) chunked differently when streamed"
+    else:
+        result = embedding_parity(args.backend, texts=passages)
+        ok = result["min_cosine"] >= args.min_cosine
+        summary = f"min cosine {result['min_cosine']:.4f} (threshold {args.min_cosine:.4f})"
+
+    print(result)
+    print(f"{'PASS' if ok else 'FAIL'}: {summary}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
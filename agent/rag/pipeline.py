@@ -1,12 +1,26 @@
 import os
 from typing import Any, Dict, List, Tuple, Iterator
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from .retrieval import retrieve
-from .planner import plan_queries
-from .llm import generate_text, generate_text_stream
+from .retrieval import retrieve_batch, EMPTY_COLLECTION_ERROR
+from .planner import plan_queries, collection_tier
+from .llm import generate_text_stream, coalesce, pick_num_ctx, max_prompt_tokens
 from .rerank import rerank
-from .vector_store import client, COLLECTION
+from .chunking import count_tokens
+from .context import build_context, CONTEXT_TOKEN_BUDGET
+from .catalog import catalog
+from .answer_cache import plan_cache, plan_key, answer_key, get_answer, put_answer
+from .conversation import conversations
+from .metrics import Spans, ANSWER_TOKENS_PER_SECOND
+from .batcher import Overloaded
+
+# Shared pool for the pre-answer stages (summary, planning, speculative retrieval)
+_stage_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PIPELINE_STAGE_WORKERS", "16")),
+    thread_name_prefix="rag-stage",
+)
+
 
 def _dedupe_hits(hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     seen: set[Tuple[str, str]] = set()
@@ -20,56 +34,97 @@ def _dedupe_hits(hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     return out
 
 
-def _summarize_chat_history(chat_history: List[dict]) -> str:
-    """Summarize recent chat history into a compact context."""
-    if not chat_history:
-        return ""
-
-    recent_history = chat_history[-6:]
-
-    history_text = "Recent conversation:\n"
-    for msg in recent_history:
-        role = msg.get("role", "user")
-        content = msg.get("content", "")[:300]
-        history_text += f"{role}: {content}\n"
+def _llm_status(label: str, stats: Dict[str, Any]) -> Dict[str, Any]:
+    """Status line reporting whether an LLM call found the model loaded."""
+    if not stats:
+        return {"type": "status", "message": f"{label} finished"}
+    wall_s = stats["wall_ms"] / 1000
+    if stats["cold"]:
+        detail = f"cold start — model load {stats['load_ms'] / 1000:.1f}s"
+    else:
+        detail = "model warm"
+    detail += f", prefill {stats['prompt_eval_ms'] / 1000:.1f}s"
+    return {"type": "status", "message": f"{label} took {wall_s:.1f}s ({detail})"}
 
-    summary_prompt = f"""
-    Summarize this conversation in 2-3 sentences. Focus on key topics and conclusions.
 
-    {history_text}
-    """.strip()
+# Fixed instructions sent as the system message, so every answer starts with
+# the same tokens and Ollama can reuse their prefill
+ANSWER_SYSTEM_PROMPT = """
+Answer the user using ONLY the context provided. Format in clean Markdown.
+Cite sources by copying the exact tags from the context (e.g. [filename.pdf#2]).
+Don't put citations inside latex. This will break latex processing. Only clean math should be inside latex delimiters.
+Every key claim must have at least one citation. Do NOT write [source#chunk] literally.
+If context is insufficient, state what is missing.
+""".strip()
 
-    summary = generate_text(summary_prompt, temperature=0.1, max_tokens=150, think=False)
-    return summary.strip()
 
+def _answer_prompt(question: str, chat_summary: str, context: str) -> str:
+    """
+    User message for the answer call, ordered from most to least stable:
+    follow-ups over the same documents share the context and only the
+    conversation and question change, so the cached prefix covers the context.
+    """
+    chat_context_section = ""
+    if chat_summary:
+        chat_context_section = f"""
+Previous Conversation:
+{chat_summary}
+"""
 
-def _stitch_context(hits: List[Dict[str, Any]], max_chunks: int = 8) -> str:
-    def key(h: Dict[str, Any]):
-        return (
-            str(h.get("source", "")),
-            str(h.get("doc_id", "")),
-            int(
-                h.get("chunk_index")
-                if h.get("chunk_index") is not None
-                else 10**9
-            ),
-        )
+    return f"""
+Context:
+{context}
+{chat_context_section}
+Question: {question}
+""".strip()
 
-    selected = hits[:max_chunks]
-    selected_sorted = sorted(selected, key=key)
 
-    stitched = []
-    for h in selected_sorted:
-        source = h.get("source", "unknown")
-        idx = h.get("chunk_index", "?")
-        stitched.append(f"[{source}#{idx}] {h.get('text', '')}")
-    return "\n\n".join(stitched)
+def _replay(cached: Dict[str, Any], spans: Spans) -> Iterator[Dict[str, Any]]:
+    """Re-emit a recorded answer without touching retrieval or the LLM."""
+    yield {"type": "status", "message": "Documents unchanged since this was last asked — replaying cached answer..."}
+    yield cached["metadata"]
+    for token in cached["tokens"]:
+        yield {"type": "token", "content": token}
+    yield {"type": "done", "llm": cached["llm"], "cached": True, "timings": spans.finish(total="cached_total")}
 
 
 def answer_question_stream(
     question: str,
     chat_history: List[dict] = None,
     selected_sources: List[str] = None,
+    conversation_id: str = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Answer `question` as a stream of status/metadata/token/done (or error)
+    events. Stage timings reach /metrics however the request ends, labelled
+    ok, error, rejected (model queue full) or cancelled (client went away).
+    """
+    spans = Spans("ask")
+    status = "cancelled"
+    try:
+        for event in _answer_stream(question, chat_history, selected_sources, conversation_id, spans):
+            if event["type"] == "error":
+                status = "error"
+            elif event["type"] == "done":
+                status = "ok"
+            yield event
+    except Overloaded:
+        status = "rejected"
+        raise
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        if not spans.finished:
+            spans.finish(status=status)
+
+
+def _answer_stream(
+    question: str,
+    chat_history: List[dict],
+    selected_sources: List[str],
+    conversation_id: str,
+    spans: Spans,
 ) -> Iterator[Dict[str, Any]]:
     enable_rerank = os.getenv("ENABLE_RERANK", "1") not in ("0", "false", "False")
     # MAX_CONTEXT_CHUNKS env var acts as a hard cap; tier-based value is used otherwise
@@ -78,66 +133,132 @@ def answer_question_stream(
     chat_history = chat_history or []
     selected_sources = selected_sources or []
 
-    # --- Count chunks/sources in the active collection ---
-    try:
-        count_result = client.count(collection_name=COLLECTION, exact=True)
-        total_chunks = count_result.count
-    except Exception:
-        total_chunks = 0
+    # --- Count chunks/sources from the document catalog (no collection scan) ---
+    with spans.span("catalog"):
+        total_chunks = catalog.total_chunks()
+        known_sources = catalog.sources()
+    if selected_sources:
+        # Only count sources the user has selected
+        source_count = len(set(known_sources) & set(selected_sources))
+    else:
+        source_count = len(known_sources)
 
-    # Count distinct sources (or cap at a scroll)
-    try:
-        scroll_result = client.scroll(
-            collection_name=COLLECTION,
-            limit=10000,
-            with_payload=["source"],
-            with_vectors=False,
-        )
-        active_sources = set()
-        for pt in scroll_result[0]:
-            if pt.payload and "source" in pt.payload:
-                # Only count sources the user has selected (or all if no filter)
-                src = pt.payload["source"]
-                if not selected_sources or src in selected_sources:
-                    active_sources.add(src)
-        source_count = len(active_sources)
-    except Exception:
-        source_count = len(selected_sources) if selected_sources else 1
+    # Cached plans/answers are keyed on this, so any ingest or delete invalidates them
+    version = catalog.version
 
     yield {
         "type": "status",
         "message": f"Indexed {total_chunks} chunks across {source_count} document(s) — planning search...",
     }
 
-    # Summarize chat context (with thinking disabled for speed)
-    chat_summary = ""
+    if total_chunks == 0:
+        # Nothing ingested: skip planning and the (possibly missing) collection entirely
+        yield {"type": "error", "error": EMPTY_COLLECTION_ERROR["error"], "plan": None}
+        return
+
+    if not chat_history:
+        cached = get_answer(answer_key(question, selected_sources, "", version))
+        if cached is not None:
+            yield from _replay(cached, spans)
+            conversations.record_turn(conversation_id, question, "".join(cached["tokens"]))
+            return
+
+    # Conversation context, planning and a speculative retrieval on the raw question run
+    # concurrently; the planner doesn't depend on the summary, and the
+    # speculative hits are merged with the planned ones.
+    summary_stats: Dict[str, Any] = {}
+    plan_stats: Dict[str, Any] = {}
+    speculative_stats: Dict[str, Any] = {}
+    speculative_top_k = collection_tier(total_chunks)["max_top_k"]
+
+    stages = {
+        _stage_pool.submit(
+            spans.wrap("speculative", retrieve_batch), [question], top_k=speculative_top_k,
+            filter_sources=selected_sources, stats=speculative_stats,
+        ): "speculative",
+    }
+    plan_cache_key = plan_key(question, selected_sources, version)
+    plan = plan_cache.get(plan_cache_key)
+    if plan is None:
+        stages[_stage_pool.submit(
+            spans.wrap("plan", plan_queries), question, chunk_count=total_chunks, source_count=source_count, stats=plan_stats
+        )] = "plan"
+    else:
+        yield {"type": "status", "message": "Reusing cached query plan"}
     if chat_history:
-        yield {"type": "status", "message": "Summarizing conversation history..."}
-        chat_summary = _summarize_chat_history(chat_history)
+        # Usually served from the rolling summary store with no LLM call
+        stages[_stage_pool.submit(
+            spans.wrap("summary", conversations.context), conversation_id, chat_history, stats=summary_stats
+        )] = "summary"
+
+    chat_summary = ""
+    speculative_hits: List[Dict[str, Any]] = []
+    for future in as_completed(stages):
+        stage = stages[future]
+        if stage == "summary":
+            chat_summary = future.result()
+            if summary_stats:
+                yield _llm_status("Conversation summary", summary_stats)
+            else:
+                yield {"type": "status", "message": "Conversation context ready (no LLM call needed)"}
+            cached = get_answer(answer_key(question, selected_sources, chat_summary, version))
+            if cached is not None:
+                yield from _replay(cached, spans)
+                conversations.record_turn(conversation_id, question, "".join(cached["tokens"]))
+                return
+        elif stage == "plan":
+            plan = future.result()
+            yield _llm_status("Query planning", plan_stats)
+            if plan.get("fallback"):
+                yield {"type": "status", "message": "No usable query plan from the model; searching with your question as asked"}
+            else:
+                # Only plans the model actually produced and that parsed
+                plan_cache.put(plan_cache_key, plan)
+        else:
+            res = future.result()
+            if isinstance(res, dict) and res.get("error"):
+                # Planning and the summary would be wasted now; drop those not yet started
+                for pending in stages:
+                    pending.cancel()
+                yield {"type": "error", "error": res["error"], "plan": plan}
+                return
+            speculative_hits = res[0]
+            yield {"type": "status", "message": f"Early search on your question: {len(speculative_hits)} hit(s)"}
 
-    # Planning — scaled to collection size
-    plan = plan_queries(question, chunk_count=total_chunks, source_count=source_count)
     queries = plan["queries"]
     top_k = plan["top_k"]
     tier_note = plan.get("tier", "")
     # Final context window: tier recommendation capped by hard override
     max_context_chunks = min(plan["max_context_chunks"], hard_cap)
 
+    # The speculative search already covered the raw question at a wider top_k
+    planned = [q for q in queries if q.strip() != question.strip()]
+
     yield {
         "type": "status",
         "message": f"Running {len(queries)} search quer{'y' if len(queries) == 1 else 'ies'} (top {top_k} per query, up to {max_context_chunks} final chunks)...",
     }
 
-    # Retrieval — emit per-query progress
-    all_hits: List[Dict[str, Any]] = []
+    # Retrieval — all planned queries share one embedding pass and one batch search
     for i, q in enumerate(queries, 1):
         short_q = q if len(q) <= 60 else q[:57] + "..."
         yield {"type": "status", "message": f"Query {i}/{len(queries)}: \"{short_q}\""}
-        res = retrieve(q, top_k=top_k, filter_sources=selected_sources)
-        if isinstance(res, dict) and res.get("error"):
-            yield {"type": "error", "error": res["error"], "plan": plan}
-            return
+
+    retrieval_stats: Dict[str, Any] = {}
+    per_query_hits = retrieve_batch(planned, top_k=top_k, filter_sources=selected_sources, stats=retrieval_stats)
+    # Planned batch only; the speculative search overlaps planning and has its own stage
+    spans.add("embed", retrieval_stats.get("embed_ms", 0) / 1000)
+    spans.add("search", retrieval_stats.get("search_ms", 0) / 1000)
+    if isinstance(per_query_hits, dict) and per_query_hits.get("error"):
+        yield {"type": "error", "error": per_query_hits["error"], "plan": plan}
+        return
+
+    all_hits: List[Dict[str, Any]] = []
+    for q, res in zip(planned, per_query_hits):
+        i = queries.index(q) + 1
+        yield {"type": "status", "message": f"Query {i}/{len(queries)}: {len(res)} hit(s)"}
         all_hits.extend(res)
+    all_hits.extend(speculative_hits)
 
     all_hits = _dedupe_hits(all_hits)
     unique_sources = len({h.get("source") for h in all_hits})
@@ -148,57 +269,81 @@ def answer_question_stream(
     }
 
     # Rerank
+    rerank_stats: Dict[str, Any] = {}
     if enable_rerank:
         yield {
             "type": "status",
             "message": f"Reranking {len(all_hits)} chunks → selecting top {max_context_chunks}...",
         }
-        all_hits = rerank(question, all_hits, top_n=max_context_chunks)
+        with spans.span("rerank"):
+            all_hits = rerank(question, all_hits, top_n=max_context_chunks, stats=rerank_stats)
     else:
         all_hits.sort(key=lambda x: (x.get("score") or 0), reverse=True)
         all_hits = all_hits[:max_context_chunks]
 
-    stitched_context = _stitch_context(all_hits, max_chunks=max_context_chunks)
+    # Pack the ranked chunks into whatever the largest num_ctx leaves after
+    # the instructions, question and conversation
+    with spans.span("context"):
+        overhead = count_tokens(ANSWER_SYSTEM_PROMPT) + count_tokens(_answer_prompt(question, chat_summary, ""))
+        budget = max(0, max_prompt_tokens() - overhead)
+        if CONTEXT_TOKEN_BUDGET:
+            budget = min(budget, CONTEXT_TOKEN_BUDGET)
+        context = build_context(all_hits, max_chunks=max_context_chunks, token_budget=budget)
+        all_hits = context["hits"]
+        stitched_context = context["text"]
+
+        final_prompt = _answer_prompt(question, chat_summary, stitched_context)
+        prompt_tokens = count_tokens(ANSWER_SYSTEM_PROMPT) + count_tokens(final_prompt)
+        num_ctx = pick_num_ctx(prompt_tokens)
 
     # Surface which sources made it into the final context
     final_sources = sorted({h.get("source", "?") for h in all_hits})
     sources_label = ", ".join(final_sources) if final_sources else "unknown"
 
-    yield {
+    metadata = {
         "type": "metadata",
         "plan": plan,
         "hits": all_hits,
         "context": stitched_context,
+        "rerank": rerank_stats,
+        "prompt": {**context["stats"], "prompt_tokens": prompt_tokens, "num_ctx": num_ctx},
+        # Everything before generation; the done event has the full set
+        "timings": spans.snapshot(),
     }
+    yield metadata
 
+    if context["stats"]["skipped"]:
+        yield {
+            "type": "status",
+            "message": f"Left out {context['stats']['skipped']} lower-ranked chunk(s) to fit the {budget}-token context budget",
+        }
     yield {
         "type": "status",
-        "message": f"Generating answer from {len(all_hits)} chunks ({sources_label})...",
+        "message": f"Generating answer from {len(all_hits)} chunks ({sources_label}) — ~{prompt_tokens} prompt tokens, num_ctx {num_ctx}...",
     }
 
-    chat_context_section = ""
-    if chat_summary:
-        chat_context_section = f"""
-Previous Conversation Summary:
-{chat_summary}
-"""
-
-    final_prompt = f"""
-Answer the user using ONLY the context below. Format in clean Markdown.
-Cite sources by copying the exact tags from the context (e.g. [filename.pdf#2]).
-Don't put citations inside latex. This will break latex processing. Only clean math should be inside latex delimiters.
-Every key claim must have at least one citation. Do NOT write [source#chunk] literally.
-If context is insufficient, state what is missing.
-{chat_context_section}
-Question: {question}
-
-Context:
-{stitched_context}
-
-Answer:
-""".strip()
-
-    for token in generate_text_stream(final_prompt, temperature=0.2):
-        yield {"type": "token", "content": token}
-
-    yield {"type": "done"}
\ No newline at end of file
+    answer_stats: Dict[str, Any] = {}
+    tokens: List[str] = []
+    # Coalesce tokens into fewer, larger NDJSON frames
+    with spans.span("generate"):
+        for token in coalesce(generate_text_stream(
+            final_prompt, temperature=0.2, num_ctx=num_ctx, stats=answer_stats, system=ANSWER_SYSTEM_PROMPT
+        )):
+            if not tokens:
+                spans.mark("first_token")
+            tokens.append(token)
+            yield {"type": "token", "content": token}
+
+    # Only answers Ollama finished are recorded (stats are filled on its done
+    # frame, so errors are skipped); a client disconnect never reaches here
+    if answer_stats:
+        put_answer(answer_key(question, selected_sources, chat_summary, version), metadata, tokens, answer_stats)
+        # Fold this turn into the conversation while the user reads the answer
+        conversations.record_turn(conversation_id, question, "".join(tokens))
+
+    timings = spans.finish()
+    if answer_stats.get("eval_ms"):
+        tokens_per_s = answer_stats["eval_tokens"] / (answer_stats["eval_ms"] / 1000)
+        ANSWER_TOKENS_PER_SECOND.observe(tokens_per_s)
+        timings["tokens_per_s"] = round(tokens_per_s, 1)
+    yield {"type": "done", "llm": answer_stats, "timings": timings}
\ No newline at end of file
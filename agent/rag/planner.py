@@ -1,8 +1,27 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from .llm import generate_json
 
+# Fixed, so Ollama can reuse its prefill across planning calls
+PLANNER_SYSTEM_PROMPT = """
+You are a retrieval planner for a local RAG system.
+Generate search queries that together fully cover the user's question from different angles, within the query count and top_k range given in the request.
+Prefer higher top_k values for exploratory or multi-faceted questions.
 
-def _collection_tier(chunk_count: int) -> Dict[str, Any]:
+Do the aforementioned strategies by default. But also look out for user instructions to determine the level or depth of the research.
+For example: If the User wants thorough research, take longer to plan and research. If the user only wants short, simple, or brief explanations only, use less chunks or plan shorter just to be able to asnwer faster.
+Only do these if there are clear instructions. If there are none. stick to the default.
+
+Return ONLY valid JSON with this schema, no other text:
+{
+    "queries": ["..."],
+    "top_k": 10,
+    "rounds": 1,
+    "notes": "short optional note"
+}
+""".strip()
+
+
+def collection_tier(chunk_count: int) -> Dict[str, Any]:
     """Return planning floors/ceilings based on collection size."""
     if chunk_count <= 30:
         return {"min_queries": 1, "max_queries": 2, "min_top_k": 6,  "max_top_k": 12, "max_context_chunks": 12, "guidance": "small collection — 1-2 focused queries"}
@@ -14,47 +33,50 @@ def _collection_tier(chunk_count: int) -> Dict[str, Any]:
         return {"min_queries": 4, "max_queries": 5, "min_top_k": 18, "max_top_k": 28, "max_context_chunks": 40, "guidance": "very large collection — 4-5 broad, diverse queries with high recall"}
 
 
-def plan_queries(question: str, chunk_count: int = 0, source_count: int = 0) -> Dict[str, Any]:
-    tier = _collection_tier(chunk_count)
+def plan_queries(
+    question: str,
+    chunk_count: int = 0,
+    source_count: int = 0,
+    stats: Optional[dict] = None,
+) -> Dict[str, Any]:
+    tier = collection_tier(chunk_count)
 
     collection_context = (
         f"The knowledge base has {chunk_count} chunks across {source_count} document(s). "
-        f"Planning guidance: {tier['guidance']}."
+        f"Planning guidance: {tier['guidance']}.\n"
     ) if chunk_count > 0 else ""
 
+    # Everything that varies per call comes after the fixed system prompt
     prompt = f"""
-    You are a retrieval planner for a local RAG system.
-    {collection_context}
-    Generate {tier['min_queries']}-{tier['max_queries']} search queries that together fully cover the question from different angles.
-    Choose top_k between {tier['min_top_k']} and {tier['max_top_k']} based on how broad the question is — prefer higher values for exploratory or multi-faceted questions.
-
-    Do the aforementioned strategies by default. But also look out for user instructions to determine the level or depth of the research.
-    For example: If the User wants thorough research, take longer to plan and research. If the user only wants short, simple, or brief explanations only, use less chunks or plan shorter just to be able to asnwer faster.
-    Only do these if there are clear instructions. If there are none. stick to the default.
-    
-    Return ONLY valid JSON with this schema, no other text:
-    {{
-        "queries": ["..."],
-        "top_k": {tier['min_top_k']},
-        "rounds": 1,
-        "notes": "short optional note"
-    }}
+{collection_context}Generate {tier['min_queries']}-{tier['max_queries']} search queries and choose top_k between {tier['min_top_k']} and {tier['max_top_k']}.
 
-    User Question: {question}
-    """.strip()
+User Question: {question}
+""".strip()
 
-    plan = generate_json(prompt, think=False)
-    if not isinstance(plan, dict):
-        return {"queries": [question], "top_k": tier["min_top_k"], "rounds": 1, "notes": ""}
+    plan = generate_json(prompt, think=False, stats=stats, system=PLANNER_SYSTEM_PROMPT)
+    queries = plan.get("queries") if isinstance(plan, dict) else None
+    queries = [q for q in queries if isinstance(q, str) and q.strip()] if isinstance(queries, list) else []
+    if not queries:
+        # Unreachable model or no usable JSON; "fallback" keeps this out of the plan cache
+        return {
+            "queries": [question],
+            "top_k": tier["min_top_k"],
+            "rounds": 1,
+            "notes": "",
+            "tier": tier["guidance"],
+            "max_context_chunks": tier["max_context_chunks"],
+            "fallback": True,
+        }
 
-    queries = plan.get("queries") or [question]
-    queries = [q for q in queries if isinstance(q, str) and q.strip()]
     # Enforce tier floors/ceilings
     queries = queries[:tier["max_queries"]]
     if len(queries) < tier["min_queries"]:
         queries = (queries + [question] * tier["min_queries"])[:tier["min_queries"]]
 
-    raw_top_k = int(plan.get("top_k", tier["min_top_k"]))
+    try:
+        raw_top_k = int(plan.get("top_k", tier["min_top_k"]))
+    except (TypeError, ValueError):
+        raw_top_k = tier["min_top_k"]
     top_k = max(tier["min_top_k"], min(raw_top_k, tier["max_top_k"]))
 
     return {
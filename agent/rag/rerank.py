@@ -1,21 +1,47 @@
 import os
+import time
+import hashlib
 import logging
-import torch
-from sentence_transformers import CrossEncoder
-from typing import Any, Dict, List
+import threading
+import numpy as np
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from .batcher import MICRO_BATCHING, MicroBatcher
+from .cache import LRUCache
+from .embedding_cache import normalize_text
+from .onnx_runtime import ensure_model, load_session, load_tokenizer, run_batches
 
 logger = logging.getLogger(__name__)
 
 RERANK_MODEL = os.getenv("RERANK_MODEL", "BAAI/bge-reranker-base")
 ENABLE_RERANK = os.getenv("ENABLE_RERANK", "1") not in ("0", "false", "False")
-
-def _get_device() -> str:
+# torch (CrossEncoder), onnx (fp32 export) or onnx-int8 (dynamically quantized export)
+RERANK_BACKEND = os.getenv("RERANK_BACKEND", "torch")
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+# (query, chunk text) pairs whose cross-encoder score is remembered
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "50000"))
+# Characters of chunk text the cross-encoder sees
+RERANK_TEXT_CHARS = 512
+# Cross-request micro-batching: wait up to this long for concurrent pairs...
+RERANK_BATCH_WAIT_MS = float(os.getenv("RERANK_BATCH_WAIT_MS", "3"))
+# ...up to this many (query, chunk) pairs per model call...
+RERANK_MAX_BATCH = int(os.getenv("RERANK_MAX_BATCH", "256"))
+# ...with at most this many pairs queued before requests are turned away
+RERANK_QUEUE_MAX = int(os.getenv("RERANK_QUEUE_MAX", "4096"))
+
+# torch and sentence_transformers are imported when the model is first loaded
+
+@lru_cache(maxsize=None)
+def get_device() -> str:
     """
     Auto-detect the best available compute device.
     - NVIDIA GPU          → 'cuda'
     - Apple Silicon MPS   → 'mps' (if supported by model)
     - Fallback            → 'cpu'
     """
+    import torch
+
     if torch.cuda.is_available():
         logger.info(f"Reranker using CUDA: {torch.cuda.get_device_name(0)}")
         return "cuda"
@@ -35,45 +61,156 @@ def _get_device() -> str:
     logger.info("Reranker using CPU")
     return "cpu"
 
-DEVICE = _get_device()
+
+class OnnxCrossEncoder:
+    """
+    `CrossEncoder.predict` work-alike running an ONNX export of the model on
+    ONNX Runtime. Pairs are tokenized once and batched by token length so
+    each batch is padded only to its own longest pair.
+    """
+
+    def __init__(self, model_id: str, quantized: bool = True):
+        self.session = load_session(ensure_model(model_id, "sequence-classification", quantized))
+        self.tokenizer = load_tokenizer(model_id)
+        self.max_length = min(self.tokenizer.model_max_length, 512)
+
+    def predict(self, pairs, show_progress_bar: bool = False, batch_size: int = RERANK_BATCH_SIZE) -> np.ndarray:
+        if not pairs:
+            return np.zeros(0, dtype=np.float32)
+        encoded = self.tokenizer(
+            [q for q, _ in pairs],
+            [p for _, p in pairs],
+            truncation=True,
+            max_length=self.max_length,
+        )
+        logits = run_batches(self.session, self.tokenizer, dict(encoded), batch_size)
+        # Single-logit relevance head; sigmoid matches CrossEncoder's default activation
+        logits = np.array([row[0] for row in logits], dtype=np.float32)
+        return 1.0 / (1.0 + np.exp(-logits))
+
+
+def load_backend(backend: str = RERANK_BACKEND):
+    if backend == "torch":
+        from sentence_transformers import CrossEncoder
+
+        return CrossEncoder(RERANK_MODEL, device=get_device())
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxCrossEncoder(RERANK_MODEL, quantized=backend == "onnx-int8")
+    raise ValueError(f"Unknown RERANK_BACKEND: {backend!r} (expected torch, onnx or onnx-int8)")
+
 
 _reranker = None
+_reranker_lock = threading.Lock()
+
+# (query hash, text hash) → score. Keyed on the text actually scored rather
+# than the point id, so re-ingested chunks keep their scores and a reused id
+# can never return a stale one.
+_score_cache = LRUCache(max_items=RERANK_CACHE_SIZE)
+# Running mean model time per pair, used to estimate time saved by cache hits
+_ms_per_pair: Optional[float] = None
+_timing_lock = threading.Lock()
 
 def _get_reranker():
     global _reranker
     if _reranker is None:
-        logger.info(f"Loading reranker model: {RERANK_MODEL} on {DEVICE}")
-        _reranker = CrossEncoder(RERANK_MODEL, device=DEVICE)
-        logger.info("Reranker model loaded")
+        with _reranker_lock:
+            if _reranker is None:
+                logger.info(f"Loading reranker model: {RERANK_MODEL} ({RERANK_BACKEND})")
+                started = time.perf_counter()
+                _reranker = load_backend()
+                logger.info(f"Reranker model loaded in {time.perf_counter() - started:.1f}s")
     return _reranker
 
 
 def preload():
-    """Eagerly load the reranker model (call at app startup)."""
+    """Load the reranker model (call from background warm-up)."""
     if ENABLE_RERANK:
         _get_reranker()
 
 
+def _digest(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _predict(pairs: List[Tuple[str, str]]) -> List[float]:
+    """Score `pairs` in one model call; pairs may come from several queries."""
+    global _ms_per_pair
+    # Longest first, so the model's batches hold pairs of similar length
+    order = sorted(range(len(pairs)), key=lambda i: -len(pairs[i][1]))
+    started = time.perf_counter()
+    predicted = _get_reranker().predict(
+        [pairs[i] for i in order],
+        show_progress_bar=False,
+        batch_size=RERANK_BATCH_SIZE,
+    )
+    model_ms = (time.perf_counter() - started) * 1000
+    with _timing_lock:
+        per_pair = model_ms / len(pairs)
+        _ms_per_pair = per_pair if _ms_per_pair is None else 0.8 * _ms_per_pair + 0.2 * per_pair
+    scores = [0.0] * len(pairs)
+    for i, s in zip(order, predicted):
+        scores[i] = float(s)
+    return scores
+
+
+# One model call serves every request that arrived within RERANK_BATCH_WAIT_MS
+_batcher = MicroBatcher(
+    "rerank", _predict,
+    max_batch=RERANK_MAX_BATCH, max_wait_ms=RERANK_BATCH_WAIT_MS, max_queue=RERANK_QUEUE_MAX,
+)
+
+
+def cache_stats() -> dict:
+    return {**_score_cache.stats(), "batching": _batcher.stats() if MICRO_BATCHING else None}
+
+
 def rerank(
     query: str,
     hits: List[Dict[str, Any]],
     top_n: int = 8,
+    stats: Optional[dict] = None,
 ) -> List[Dict[str, Any]]:
-    """Rerank hits using cross-encoder. Falls back to original order if disabled."""
+    """
+    Rerank hits using cross-encoder. Falls back to original order if disabled.
+    Only pairs missing from the score cache are sent to the model, batched
+    with other requests' pairs (raises batcher.Overloaded when that queue
+    stays full). If `stats` is given it receives pair/hit counts, model time
+    (including any batching wait) and estimated time saved.
+    """
     if not ENABLE_RERANK or not hits:
         return hits[:top_n]
 
-    reranker = _get_reranker()
-
-    pairs = [(query, h.get("text", "")[:512]) for h in hits]
-
-    scores = reranker.predict(
-        pairs,
-        show_progress_bar=False,
-    )
+    # Score the normalized query too, so the cache key stays truthful
+    query = normalize_text(query)
+    query_key = _digest(f"{RERANK_MODEL}\0{RERANK_BACKEND}\0{query}")
+    texts = [h.get("text", "")[:RERANK_TEXT_CHARS] for h in hits]
+    keys = [(query_key, _digest(t)) for t in texts]
+
+    scores: List[Optional[float]] = [_score_cache.get(k) for k in keys]
+    misses = [i for i, s in enumerate(scores) if s is None]
+
+    model_ms = 0.0
+    if misses:
+        pairs = [(query, texts[i]) for i in misses]
+        started = time.perf_counter()
+        predicted = _batcher.submit(pairs) if MICRO_BATCHING else _predict(pairs)
+        model_ms = (time.perf_counter() - started) * 1000
+        for i, s in zip(misses, predicted):
+            scores[i] = s
+            _score_cache.put(keys[i], s)
 
     for h, s in zip(hits, scores):
-        h["rerank_score"] = float(s)
+        h["rerank_score"] = s
+
+    if stats is not None:
+        cached = len(hits) - len(misses)
+        stats.update({
+            "pairs": len(hits),
+            "cached": cached,
+            "hit_rate": round(cached / len(hits), 4),
+            "model_ms": round(model_ms, 1),
+            "saved_ms": round(cached * (_ms_per_pair or 0.0), 1),
+        })
 
     ranked = sorted(hits, key=lambda x: x.get("rerank_score", 0), reverse=True)
     return ranked[:top_n]
\ No newline at end of file
@@ -1,14 +1,15 @@
-from .vector_store import client, COLLECTION
+import time
+
+from .vector_store import client, COLLECTION, search_params, is_missing_collection
 from .embeddings import embed_text
-from qdrant_client.http.exceptions import UnexpectedResponse
-from qdrant_client.models import Filter, FieldCondition, MatchAny
+from qdrant_client.models import Filter, FieldCondition, MatchAny, QueryRequest
+
+EMPTY_COLLECTION_ERROR = {"error": "Collection is empty. Please ingest documents first."}
 
-def retrieve(query, top_k=20, filter_sources=None):
-    query_embedding = embed_text(query)[0]
 
-    query_filter = None
+def _source_filter(filter_sources):
     if filter_sources and len(filter_sources) > 0:
-        query_filter = Filter(
+        return Filter(
             must=[
                 FieldCondition(
                     key="source",
@@ -16,6 +17,26 @@ def retrieve(query, top_k=20, filter_sources=None):
                 )
             ]
         )
+    return None
+
+
+def _to_hits(points):
+    hits = []
+
+    for point in points:
+        hits.append(
+            {
+                "id": str(point.id),
+                "score": float(point.score) if point.score is not None else None,
+                **(point.payload or {}),
+            }
+        )
+
+    return hits
+
+
+def retrieve(query, top_k=20, filter_sources=None):
+    query_embedding = embed_text(query)[0]
 
     try:
         results = client.query_points(
@@ -24,23 +45,58 @@ def retrieve(query, top_k=20, filter_sources=None):
             limit=top_k,
             with_payload=True,
             with_vectors=False,
-            query_filter=query_filter
+            query_filter=_source_filter(filter_sources),
+            search_params=search_params(),
         )
-
-        hits = []
-
-        for point in results.points:
-            hits.append(
-                {
-                    "id": str(point.id),
-                    "score": float(point.score) if point.score is not None else None,
-                    **(point.payload or {}),
-                }
-            )
-
-        return hits
-    except UnexpectedResponse as e:
-        if "doesn't exist" in str(e) or "404" in str(e):
-            return {"error": "Collection is empty. Please ingest documents first."}
+        return _to_hits(results.points)
+    except Exception as e:
+        # REST, gRPC and local mode each report a missing collection differently
+        if is_missing_collection(e):
+            return EMPTY_COLLECTION_ERROR
         raise
 
+
+def retrieve_batch(queries, top_k=20, filter_sources=None, stats=None):
+    """
+    Run several queries with one embedding call and one Qdrant batch search.
+    Returns a list of hit lists aligned with `queries`. If `stats` is given
+    it is filled with embed_ms and search_ms for the batch.
+    """
+    if not queries:
+        return []
+
+    started = time.perf_counter()
+    query_embeddings = embed_text(list(queries))
+    embedded = time.perf_counter()
+    query_filter = _source_filter(filter_sources)
+    params = search_params()
+
+    requests = [
+        QueryRequest(
+            query=emb,
+            limit=top_k,
+            filter=query_filter,
+            params=params,
+            with_payload=True,
+            with_vector=False,
+        )
+        for emb in query_embeddings
+    ]
+
+    try:
+        responses = client.query_batch_points(
+            collection_name=COLLECTION,
+            requests=requests,
+        )
+        if stats is not None:
+            stats.update({
+                "queries": len(requests),
+                "embed_ms": round((embedded - started) * 1000, 1),
+                "search_ms": round((time.perf_counter() - embedded) * 1000, 1),
+            })
+        return [_to_hits(r.points) for r in responses]
+    except Exception as e:
+        # REST, gRPC and local mode each report a missing collection differently
+        if is_missing_collection(e):
+            return EMPTY_COLLECTION_ERROR
+        raise
@@ -1,42 +1,378 @@
+import grpc
 from qdrant_client import QdrantClient
-from qdrant_client.models import VectorParams, Distance, PointStruct
+from qdrant_client.http.exceptions import UnexpectedResponse
+from qdrant_client.models import (
+    VectorParams, Distance, PointStruct, PayloadSchemaType,
+    Filter, FieldCondition, MatchValue, MatchAny,
+    HnswConfigDiff, ScalarQuantization, ScalarQuantizationConfig, ScalarType,
+    SearchParams, QuantizationSearchParams,
+    PointIdsList, SetPayload, SetPayloadOperation,
+)
 
 import os
 import uuid
+import logging
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .cache import LRUCache
+
+logger = logging.getLogger(__name__)
 
 QDRANT_URL = os.getenv("QDRANT_HOST", "http://qdrant:6333")
+# gRPC (port QDRANT_GRPC_PORT) sends vectors as packed protobuf floats instead of JSON text
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "0") not in ("0", "false", "False")
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+QDRANT_TIMEOUT = int(os.getenv("QDRANT_TIMEOUT", "60"))
+# Points per upload request and upload worker processes (1 = upload in-process)
+QDRANT_UPLOAD_BATCH = int(os.getenv("QDRANT_UPLOAD_BATCH", "256"))
+QDRANT_UPLOAD_PARALLEL = int(os.getenv("QDRANT_UPLOAD_PARALLEL", "1"))
+# When ingestion waits for Qdrant to apply writes: "always" (every batch),
+# "last" (only a document's final batch; updates apply in order, so the
+# whole document is searchable when it returns) or "never"
+QDRANT_WRITE_WAIT = os.getenv("QDRANT_WRITE_WAIT", "last")
+CHUNK_CACHE_SIZE = int(os.getenv("CHUNK_CACHE_SIZE", "2048"))
+
+
+def is_missing_collection(e: Exception) -> bool:
+    """
+    Whether `e` means the collection doesn't exist, for every transport:
+    REST (404 UnexpectedResponse), gRPC (NOT_FOUND) and local mode (ValueError).
+    """
+    if isinstance(e, UnexpectedResponse):
+        return e.status_code == 404 or "doesn't exist" in str(e)
+    if isinstance(e, grpc.RpcError):
+        return e.code() == grpc.StatusCode.NOT_FOUND
+    return isinstance(e, ValueError) and "not found" in str(e)
 
-client = QdrantClient(url=QDRANT_URL)
+
+def make_client(url: str = QDRANT_URL) -> QdrantClient:
+    """
+    Build a Qdrant client for `url`. ":memory:" (or a filesystem path) gives
+    the in-process local mode, useful for benchmarks and offline runs.
+    """
+    if url == ":memory:" or not url.startswith(("http://", "https://")):
+        return QdrantClient(location=url) if url == ":memory:" else QdrantClient(path=url)
+    return QdrantClient(
+        url=url,
+        prefer_grpc=QDRANT_PREFER_GRPC,
+        grpc_port=QDRANT_GRPC_PORT,
+        timeout=QDRANT_TIMEOUT,
+    )
+
+
+# The process-wide client; everything that talks to Qdrant imports this one
+client = make_client()
 
 COLLECTION = "notebook_docs"
 
-def create_collection(vector_size):
-    collections = client.get_collections().collections
-    if COLLECTION not in [c.name for c in collections]:
-        client.create_collection(
-            collection_name = COLLECTION,
-            vectors_config = VectorParams(
-                size=vector_size,
-                distance=Distance.COSINE
-            )
-        )
-
-def insert_chunks(chunks, embeddings, metadata):
-    points = []
-
-    for (chunk, emb) in zip(chunks, embeddings):
-        payload = {
-            "text": chunk["text"],
-            "chunk_index": chunk.get("chunk_index"),
-            **metadata,
-        }
-
-        points.append(
-            PointStruct(
-                id=str(uuid.uuid4()),
-                vector=emb,
-                payload=payload
-            )
-        )
-    
-    client.upsert(collection_name=COLLECTION, points=points)
\ No newline at end of file
+# Collection tuning profiles. Settings apply when the collection is created;
+# switching profile takes effect after /clear-all (or a fresh Qdrant volume).
+#   quantization  int8 scalar copies of the vectors, kept in RAM for search
+#   rescore       re-rank quantized candidates with the original vectors
+#   oversampling  candidates fetched per result before rescoring
+#   on_disk       original vectors (and HNSW graph) memory-mapped from disk
+#   hnsw_ef       search-time beam width (None = Qdrant default)
+COLLECTION_PROFILES = {
+    # fp32 vectors in RAM, Qdrant's default HNSW (m=16, ef_construct=100)
+    "default": {},
+    # ~4x less vector RAM, near-identical recall thanks to rescoring
+    "quantized": {"quantization": "int8", "rescore": True, "oversampling": 2.0},
+    # Only the int8 copies stay in RAM; for collections with 100k+ chunks
+    "low-memory": {
+        "quantization": "int8", "rescore": True, "oversampling": 3.0,
+        "on_disk": True, "hnsw_m": 16, "ef_construct": 100,
+    },
+    # Denser graph and wider search for maximum recall
+    "high-recall": {"hnsw_m": 32, "ef_construct": 256, "hnsw_ef": 256},
+}
+
+QDRANT_PROFILE = os.getenv("QDRANT_PROFILE", "default")
+# Per-setting overrides on top of the profile
+_PROFILE_OVERRIDES = {
+    "hnsw_m": ("QDRANT_HNSW_M", int),
+    "ef_construct": ("QDRANT_EF_CONSTRUCT", int),
+    "hnsw_ef": ("QDRANT_HNSW_EF", int),
+    "on_disk": ("QDRANT_ON_DISK", lambda v: v not in ("0", "false", "False")),
+    "quantization": ("QDRANT_QUANTIZATION", lambda v: None if v in ("", "none") else v),
+}
+
+# Namespace for deterministic point ids (uuid5 of source + chunk text hash)
+POINT_ID_NAMESPACE = uuid.UUID("6f1c3a52-8d0e-4f7b-9a61-2b7e4c9d0a13")
+
+# Payload fields used in filters: source (retrieval, deletion, chunk lookup),
+# chunk_index (chunk lookup) and doc_id.
+PAYLOAD_INDEXES = {
+    "source": PayloadSchemaType.KEYWORD,
+    "doc_id": PayloadSchemaType.KEYWORD,
+    "chunk_index": PayloadSchemaType.INTEGER,
+}
+
+_indexes_checked = False
+
+# (source, chunk_index) → chunk text, for viewer highlighting
+_chunk_cache = LRUCache(max_items=CHUNK_CACHE_SIZE)
+
+
+def _ensure_payload_indexes(collection: str = COLLECTION):
+    """Create keyword/integer payload indexes (a no-op if they already exist)."""
+    global _indexes_checked
+    for field, schema in PAYLOAD_INDEXES.items():
+        client.create_payload_index(
+            collection_name=collection,
+            field_name=field,
+            field_schema=schema,
+        )
+    if collection == COLLECTION:
+        _indexes_checked = True
+
+
+def collection_profile(name: Optional[str] = None) -> Dict[str, Any]:
+    """Resolved settings for a profile (QDRANT_PROFILE by default), with env overrides."""
+    name = name or QDRANT_PROFILE
+    if name not in COLLECTION_PROFILES:
+        raise ValueError(f"Unknown QDRANT_PROFILE {name!r}; expected one of {sorted(COLLECTION_PROFILES)}")
+    profile = {"name": name, **COLLECTION_PROFILES[name]}
+    for key, (env, parse) in _PROFILE_OVERRIDES.items():
+        if os.getenv(env) is not None:
+            profile[key] = parse(os.getenv(env))
+    return profile
+
+
+_active_profile = collection_profile()
+
+
+def search_params(profile: Optional[Dict[str, Any]] = None) -> Optional[SearchParams]:
+    """Query-time parameters matching the collection's profile (None = server defaults)."""
+    profile = profile or _active_profile
+    quantization = None
+    if profile.get("quantization"):
+        quantization = QuantizationSearchParams(
+            rescore=profile.get("rescore", True),
+            oversampling=profile.get("oversampling"),
+        )
+    if profile.get("hnsw_ef") is None and quantization is None:
+        return None
+    return SearchParams(hnsw_ef=profile.get("hnsw_ef"), quantization=quantization)
+
+
+def _create(collection: str, vector_size: int, profile: Dict[str, Any]) -> None:
+    on_disk = bool(profile.get("on_disk"))
+    hnsw = None
+    if "hnsw_m" in profile or "ef_construct" in profile or on_disk:
+        hnsw = HnswConfigDiff(
+            m=profile.get("hnsw_m"),
+            ef_construct=profile.get("ef_construct"),
+            on_disk=on_disk or None,
+        )
+    quantization = None
+    if profile.get("quantization") == "int8":
+        quantization = ScalarQuantization(
+            scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+    elif profile.get("quantization"):
+        raise ValueError(f"Unsupported quantization {profile['quantization']!r} (only int8)")
+
+    client.create_collection(
+        collection_name=collection,
+        vectors_config=VectorParams(size=vector_size, distance=Distance.COSINE, on_disk=on_disk or None),
+        hnsw_config=hnsw,
+        quantization_config=quantization,
+        on_disk_payload=on_disk or None,
+    )
+    logger.info(f"Created collection {collection} (profile {profile['name']}: {profile})")
+
+
+def create_collection(vector_size, profile: Optional[Dict[str, Any]] = None, collection: str = COLLECTION):
+    """
+    The single place collections are created: with `profile` (default: the
+    configured QDRANT_PROFILE) and the payload indexes, if it doesn't exist yet.
+    """
+    if not client.collection_exists(collection):
+        _create(collection, vector_size, profile or _active_profile)
+        _ensure_payload_indexes(collection)
+        return
+    if collection == COLLECTION and not _indexes_checked:
+        # Collections created before payload indexing existed
+        _ensure_payload_indexes()
+
+
+def reset_collection(vector_size=768):
+    """Drop every point by recreating the collection (with its payload indexes)."""
+    client.delete_collection(collection_name=COLLECTION)
+    create_collection(vector_size)
+    invalidate_chunk_cache()
+
+
+def chunk_point_id(source: str, text_hash: str, occurrence: int = 0) -> str:
+    """
+    Deterministic point id for a chunk: the same text in the same document
+    always maps to the same point, so retried or repeated uploads overwrite
+    rather than duplicate. `occurrence` tells identical chunks apart.
+    """
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{source}\0{text_hash}\0{occurrence}"))
+
+
+def insert_chunks(chunks, embeddings, metadata, wait: bool = True):
+    """
+    Upload points in QDRANT_UPLOAD_BATCH-sized requests (across
+    QDRANT_UPLOAD_PARALLEL workers). With `wait=False` this returns once
+    Qdrant has accepted the writes, before they are indexed. Chunks carrying
+    an "id" (see chunk_point_id) are upserted under it.
+    """
+    points = (
+        PointStruct(
+            id=chunk.get("id") or str(uuid.uuid4()),
+            vector=emb,
+            payload={
+                "text": chunk["text"],
+                "chunk_index": chunk.get("chunk_index"),
+                "text_hash": chunk.get("text_hash"),
+                **metadata,
+            },
+        )
+        for chunk, emb in zip(chunks, embeddings)
+    )
+
+    client.upload_points(
+        collection_name=COLLECTION,
+        points=points,
+        batch_size=QDRANT_UPLOAD_BATCH,
+        parallel=QDRANT_UPLOAD_PARALLEL,
+        wait=wait,
+    )
+    invalidate_chunk_cache(metadata.get("source"))
+
+
+def source_points(source: str) -> Dict[str, Dict[str, Any]]:
+    """Point id → {chunk_index, text_hash} for every stored chunk of one document."""
+    if not client.collection_exists(COLLECTION):
+        return {}
+    found: Dict[str, Dict[str, Any]] = {}
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=COLLECTION,
+            scroll_filter=Filter(must=[FieldCondition(key="source", match=MatchValue(value=source))]),
+            limit=1000,
+            offset=offset,
+            with_payload=["chunk_index", "text_hash"],
+            with_vectors=False,
+        )
+        for pt in points:
+            found[str(pt.id)] = pt.payload or {}
+        if offset is None:
+            return found
+
+
+def count_points(source: Optional[str] = None) -> int:
+    """Exact number of stored points (of one document if `source` is given); 0 without a collection."""
+    count_filter = None
+    if source is not None:
+        count_filter = Filter(must=[FieldCondition(key="source", match=MatchValue(value=source))])
+    try:
+        return client.count(collection_name=COLLECTION, count_filter=count_filter, exact=True).count
+    except Exception as e:
+        if is_missing_collection(e):
+            return 0
+        raise
+
+
+def update_chunk_indexes(source: str, indexes: Dict[str, int], wait: bool = True) -> None:
+    """Move existing points to new chunk positions (payload only, vectors untouched)."""
+    if not indexes:
+        return
+    client.batch_update_points(
+        collection_name=COLLECTION,
+        update_operations=[
+            SetPayloadOperation(set_payload=SetPayload(payload={"chunk_index": index}, points=[point_id]))
+            for point_id, index in indexes.items()
+        ],
+        wait=wait,
+    )
+    invalidate_chunk_cache(source)
+
+
+def delete_points(source: str, point_ids: List[str], wait: bool = True) -> None:
+    if not point_ids:
+        return
+    client.delete(
+        collection_name=COLLECTION,
+        points_selector=PointIdsList(points=point_ids),
+        wait=wait,
+    )
+    invalidate_chunk_cache(source)
+
+
+def delete_source(source: str) -> None:
+    """Delete every point of one document (nothing to do if there is no collection)."""
+    try:
+        client.delete(
+            collection_name=COLLECTION,
+            points_selector=Filter(
+                must=[FieldCondition(key="source", match=MatchValue(value=source))]
+            ),
+        )
+    except Exception as e:
+        if not is_missing_collection(e):
+            raise
+    invalidate_chunk_cache(source)
+
+
+def invalidate_chunk_cache(source: Optional[str] = None):
+    if source is None:
+        _chunk_cache.clear()
+    else:
+        _chunk_cache.discard_where(lambda key: key[0] == source)
+
+
+def get_chunk_texts(pairs: Iterable[Tuple[str, int]]) -> Dict[Tuple[str, int], str]:
+    """
+    Look up chunk texts for many (source, chunk_index) pairs. Cached pairs are
+    served from memory; the rest are fetched with a single filtered scroll.
+    Pairs that don't exist are omitted from the result.
+    """
+    wanted = list(dict.fromkeys((str(s), int(i)) for s, i in pairs))
+    found: Dict[Tuple[str, int], str] = {}
+    missing: Dict[str, List[int]] = defaultdict(list)
+
+    for key in wanted:
+        text = _chunk_cache.get(key)
+        if text is None:
+            missing[key[0]].append(key[1])
+        else:
+            found[key] = text
+
+    if not missing:
+        return found
+
+    scroll_filter = Filter(
+        should=[
+            Filter(must=[
+                FieldCondition(key="source", match=MatchValue(value=source)),
+                FieldCondition(key="chunk_index", match=MatchAny(any=indexes)),
+            ])
+            for source, indexes in missing.items()
+        ]
+    )
+
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=COLLECTION,
+            scroll_filter=scroll_filter,
+            limit=max(len(wanted), 16),
+            offset=offset,
+            with_payload=["source", "chunk_index", "text"],
+            with_vectors=False,
+        )
+        for pt in points:
+            payload = pt.payload or {}
+            key = (payload.get("source"), payload.get("chunk_index"))
+            if key not in found:
+                found[key] = payload.get("text", "")
+                _chunk_cache.put(key, found[key])
+        if offset is None:
+            break
+
+    return found
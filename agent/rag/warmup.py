@@ -0,0 +1,73 @@
+import os
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# How long a model-dependent request waits for warm-up before giving up
+READY_TIMEOUT_S = float(os.getenv("READY_TIMEOUT_S", "300"))
+
+
+class Warmup:
+    """
+    Runs startup steps (model loads, catalog) in order on a background thread
+    so the server can bind and answer light routes immediately. Routes that
+    need the models call `wait()`; `/readyz` reports `status()`.
+    """
+
+    def __init__(self, steps: List[Tuple[str, Callable[[], Any]]]):
+        self._steps = steps
+        self._steps_state: Dict[str, Dict[str, Any]] = {name: {"status": "pending"} for name, _ in steps}
+        self._finished = threading.Event()
+        self._lock = threading.Lock()
+        self.ready = False
+        self.error: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.seconds: Optional[float] = None
+
+    def start(self) -> None:
+        self.started_at = time.perf_counter()
+        threading.Thread(target=self._run, name="warmup", daemon=True).start()
+
+    def wait(self, timeout: float = READY_TIMEOUT_S) -> bool:
+        """Block until warm-up finishes (or `timeout`); True if everything loaded."""
+        self._finished.wait(timeout)
+        return self.ready
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            steps = {name: dict(state) for name, state in self._steps_state.items()}
+        return {
+            "ready": self.ready,
+            "error": self.error,
+            "seconds": self.seconds,
+            "steps": steps,
+        }
+
+    def _set(self, name: str, **fields) -> None:
+        with self._lock:
+            self._steps_state[name].update(fields)
+
+    def _run(self) -> None:
+        try:
+            for name, step in self._steps:
+                self._set(name, status="running")
+                started = time.perf_counter()
+                try:
+                    step()
+                except Exception as e:
+                    logger.exception(f"Warm-up step '{name}' failed")
+                    self._set(name, status="error", message=str(e))
+                    self.error = f"{name}: {e}"
+                    return
+                elapsed = round(time.perf_counter() - started, 2)
+                self._set(name, status="done", seconds=elapsed)
+                logger.info(f"Warm-up step '{name}' finished in {elapsed:.2f}s")
+            self.ready = True
+        finally:
+            self.seconds = round(time.perf_counter() - self.started_at, 2)
+            self._finished.set()
+            if self.ready:
+                logger.info(f"Warm-up complete in {self.seconds:.2f}s — ready for queries")
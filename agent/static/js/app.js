@@ -1,7 +1,14 @@
 let chatHistory = [];
+let conversationId = newConversationId();
 let isProcessing = false;
 let selectedSources = new Set();
 
+// Lets the server keep a rolling summary of this conversation
+function newConversationId() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
 // DOM Elements
 const uploadModal = document.getElementById('uploadModal');
 const confirmModal = document.getElementById('confirmModal');
@@ -126,13 +133,20 @@ async function uploadFiles(files) {
             body: formData
         });
 
-        uploadStatus.textContent = 'Embedding documents...';
-        progressFill.style.width = '60%';
-
         const result = await response.json();
-        
+        if (!response.ok) {
+            throw new Error(result.detail || `Upload failed (${response.status})`);
+        }
+
+        const errors = [...result.rejected];
+        if (result.job_id) {
+            const job = await followIngestionJob(result.job_id);
+            (job ? job.files : [])
+                .filter(f => f.stage === 'error')
+                .forEach(f => errors.push({ filename: f.filename, message: f.message }));
+        }
+
         // Check for errors
-        const errors = result.results.filter(r => r.status === 'error');
         if (errors.length > 0) {
             const errorMsg = errors.map(e => `${e.filename}: ${e.message}`).join('\n');
             alert('Some files failed to upload:\n' + errorMsg);
@@ -160,6 +174,43 @@ async function uploadFiles(files) {
     }
 }
 
+// Follow an ingestion job's NDJSON progress stream; resolves with the final snapshot
+async function followIngestionJob(jobId) {
+    const response = await fetch(`/jobs/${jobId}/stream`);
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let snapshot = null;
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+
+        for (const line of lines) {
+            if (!line.trim()) continue;
+            snapshot = JSON.parse(line);
+
+            const active = snapshot.files.find(f => !['queued', 'done', 'error'].includes(f.stage));
+            const fraction = snapshot.files_done / snapshot.files_total;
+            progressFill.style.width = `${Math.round(30 + fraction * 70)}%`;
+
+            if (active) {
+                const rate = active.chunks_per_s ? ` (${active.chunks_per_s} chunks/s)` : '';
+                uploadStatus.textContent =
+                    `${active.stage[0].toUpperCase() + active.stage.slice(1)} ${active.filename} — ` +
+                    `${active.chunks_embedded} chunks${rate} [${snapshot.files_done}/${snapshot.files_total}]`;
+            } else if (snapshot.status === 'queued') {
+                uploadStatus.textContent = 'Waiting in ingestion queue...';
+            }
+        }
+    }
+    return snapshot;
+}
+
 // Load Documents
 async function loadDocuments() {
     try {
@@ -344,6 +395,7 @@ async function sendMessage(retryUserDiv) {
             body: JSON.stringify({
                 question,
                 chat_history: chatHistory.slice(-6),
+                conversation_id: conversationId,
                 selected_sources: Array.from(selectedSources)
             })
         });
@@ -381,6 +433,11 @@ async function sendMessage(retryUserDiv) {
                     chatMessages.scrollTop = chatMessages.scrollHeight;
                 }
 
+                if (data.type === 'error') {
+                    statusDiv.remove();
+                    answerDiv.textContent = 'Error: ' + data.error;
+                }
+
                 if (data.type === 'token') {
                     // Remove status on first token
                     if (firstToken) {
@@ -446,6 +503,7 @@ clearChatBtn.onclick = () => {
         'Are you sure you want to clear the chat history?',
         () => {
             chatHistory = [];
+            conversationId = newConversationId();
             chatMessages.innerHTML = '<div class="welcome-message"><h2>Chat Cleared</h2><p>Start a new conversation</p></div>';
         }
     );
@@ -460,6 +518,7 @@ newChatBtn.onclick = () => {
             try {
                 await fetch('/clear-all', { method: 'DELETE' });
                 chatHistory = [];
+                conversationId = newConversationId();
                 selectedSources.clear();
                 chatMessages.innerHTML = '<div class="welcome-message"><h2>Welcome to I Hate Reading</h2><p>A Local NotebookLM Clone by lemonjerome.</p></div>';
                 documentList.innerHTML = '<p class="empty-state">No documents uploaded yet</p>';